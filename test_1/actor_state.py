@@ -0,0 +1,138 @@
+import carla
+
+
+class ActorState(object):
+
+    """
+    State of an actor at one simulation frame, read from a world snapshot.
+
+    Exposes the same getters as carla.Actor (get_transform, get_location, get_velocity, get_acceleration),
+    so it can be passed to Dynamics, Visualizer and the telemetry writer in place of the actor. Every
+    getter returns the cached value, without a round trip to the server.
+
+    Attributes:
+        id (int): Actor id.
+        type_id (str): Blueprint name of the actor.
+        bounding_box (carla.BoundingBox): Bounding box of the actor, read once when the actor is tracked.
+        frame (int): Simulation frame of the state.
+
+    Example:
+        state = ActorState(ego_vehicle.id, ego_vehicle.type_id, ego_vehicle.bounding_box, world.get_snapshot().find(ego_vehicle.id))
+        print(state.get_velocity())
+    """
+
+    __slots__ = ('id', 'type_id', 'bounding_box', 'frame', '_transform', '_velocity', '_acceleration', '_angular_velocity')
+
+    def __init__(self, actor_id: int, type_id: str, bounding_box: carla.BoundingBox, actor_snapshot, frame: int = None):
+        self.id = actor_id
+        self.type_id = type_id
+        self.bounding_box = bounding_box
+        self.frame = frame
+        self._transform = actor_snapshot.get_transform()
+        self._velocity = actor_snapshot.get_velocity()
+        self._acceleration = actor_snapshot.get_acceleration()
+        self._angular_velocity = actor_snapshot.get_angular_velocity()
+
+    def get_transform(self) -> carla.Transform:
+        return self._transform
+
+    def get_location(self) -> carla.Location:
+        return self._transform.location
+
+    def get_velocity(self) -> carla.Vector3D:
+        return self._velocity
+
+    def get_acceleration(self) -> carla.Vector3D:
+        return self._acceleration
+
+    def get_angular_velocity(self) -> carla.Vector3D:
+        return self._angular_velocity
+
+
+class ActorStateCache(object):
+
+    """
+    Reads the state of a set of actors once per tick from the world snapshot.
+
+    The static data of every tracked actor (id, blueprint name and bounding box) is read once, when the
+    actor is added. On every tick the states of all the tracked actors are built from a single world
+    snapshot, the one returned by `Scene.tick` when available, so the main loop reads each actor once
+    per frame instead of calling the actor getters several times.
+
+    Attributes:
+        world (carla.World): The Carla world of the actors.
+        frame (int): Simulation frame of the current states, None before the first update.
+        states (dict[int, ActorState]): Current state of every tracked actor, keyed by actor id.
+
+    Methods:
+        add: Track more actors.
+        update: Refresh the states of all the tracked actors from a world snapshot.
+        get: Get the current state of an actor.
+
+    Example:
+        cache = ActorStateCache(world, ego_vehicle, stationary_vehicle)
+        with Scene(world, camera_front) as sync_mode:
+            data = sync_mode.tick(timeout=2.0)
+            cache.update(data[0])
+            ego_state = cache[ego_vehicle]
+            speed = ego_state.get_velocity().length()
+    """
+
+    def __init__(self, world: carla.World, *actors):
+        self.world = world
+        self.frame = None
+        self.states = {}
+        self._static = {}
+        self.add(*actors)
+
+    def add(self, *actors) -> None:
+        """
+        Track more actors.
+
+        Args:
+            *actors (carla.Actor): Actors whose state is read on every update.
+        """
+        for actor in actors:
+            self._static[actor.id] = (actor.type_id, actor.bounding_box)
+
+    def update(self, world_snapshot: carla.WorldSnapshot = None) -> dict[int, ActorState]:
+        """
+        Refresh the states of all the tracked actors.
+
+        Args:
+            world_snapshot (carla.WorldSnapshot, optional): Snapshot of the current frame, as received by
+                the world on_tick callback. Defaults to None, which requests one with `world.get_snapshot()`.
+
+        Returns:
+            dict[int, ActorState]: Current state of every tracked actor, keyed by actor id. Actors missing
+            from the snapshot (destroyed) are dropped.
+        """
+        if world_snapshot is None:
+            world_snapshot = self.world.get_snapshot()
+        self.frame = world_snapshot.frame
+
+        states = {}
+        for actor_id, (type_id, bounding_box) in self._static.items():
+            actor_snapshot = world_snapshot.find(actor_id)
+            if actor_snapshot is not None:
+                states[actor_id] = ActorState(actor_id, type_id, bounding_box, actor_snapshot, self.frame)
+        self.states = states
+        return states
+
+    def get(self, actor) -> ActorState:
+        """
+        Get the current state of an actor.
+
+        Args:
+            actor: The actor, or its id.
+
+        Returns:
+            ActorState: The state of the actor at the last update, None if it is not tracked.
+        """
+        return self.states.get(getattr(actor, 'id', actor))
+
+    def __getitem__(self, actor) -> ActorState:
+        return self.states[getattr(actor, 'id', actor)]
+
+    def __contains__(self, actor) -> bool:
+        return getattr(actor, 'id', actor) in self.states
@@ -1,99 +1,421 @@
+import argparse
+import collections
+import contextlib
 import csv
+import glob
+import logging
+import os
+import shutil
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+
 import matplotlib.pyplot as plt
 import numpy as np
-from matplotlib.animation import FuncAnimation
+from PIL import GifImagePlugin, Image
+
+from telemetry_schema import BOX_FIELDS, BOX_PREFIX, TELEMETRY_FIELDS, box_filename, npz_parts_dir, read_npz_parts
 
 SIMULATION_TIME_STEP = 0.05  # seconds
 filename = './test_1/data.csv'
 
-# Read data from CSV file
+BBOX_CORNERS = ('top_left', 'top_right', 'bottom_left', 'bottom_right')
+
+# Ragged table of the boxes of all the targets, see telemetry_schema.BOX_FIELDS
+BOX_DTYPE = np.dtype([('row', np.int64), ('actor_id', np.int64)] + [(name, np.float64) for name in BOX_FIELDS[2:]])
+
+STOP_SPEED_THRESHOLD = 0.1  # m/s, below this speed the ego vehicle is considered stopped
+RUN_EXTENSIONS = ('.csv', '.npz')
+METRIC_FIELDS = ('run', 'samples', 'min_relative_distance', 'stop_distance', 'peak_deceleration', 'peak_jerk', 'time_to_stop')
+
+# Read data from CSV or NPZ file into a single structured array
 
 def read_data(filename):
+    if os.path.splitext(filename)[1].lower() == '.npz':
+        return read_npz(filename)
+
     with open(filename, 'r') as csvfile:
-            reader = csv.DictReader(csvfile)
-            data = list(reader)
-            return data
-
-def plot_state(data):
-    
-    # Extract velocity in Y direction
-    velocity_y = [float(row['velocity_y']) for row in data]
-    figure = plt.figure(figsize=(8, 6))
-    plt.plot([x * SIMULATION_TIME_STEP for x in range(len(velocity_y))], velocity_y, marker='o')
-    plt.xlabel('Time Step')
-    plt.ylabel('Velocity (m/s)')
-    plt.title('Velocity in Y direction')
-    plt.grid()
-    plt.show()
-
-    # Extract acceleration in Y direction
-    acceleration_y = [float(row['acceleration_y']) for row in data]
-    figure = plt.figure(figsize=(8, 6))
-    plt.plot([x * SIMULATION_TIME_STEP for x in range(len(acceleration_y))], acceleration_y, marker='o')
-    plt.xlabel('Time Step')
-    plt.ylabel('Acceleration (m/s^2)')
-    plt.title('Acceleration in Y direction')
-    plt.grid()
-    plt.show()
-
-    # Extract jerk in Y direction
-    jerk_y = [float(row['jerk_y']) for row in data]
-    figure = plt.figure(figsize=(8, 6))
-    plt.plot([x * SIMULATION_TIME_STEP for x in range(len(jerk_y))], jerk_y, marker='o')
-    plt.xlabel('Time Step')
-    plt.ylabel('Jerk (m/s^3)')
-    plt.title('Jerk in Y direction')
-    plt.grid()
-    plt.show()
-
-    # Extract relative_distance:
-    relative_distance = [float(row['relative_distance']) for row in data]
-    figure = plt.figure(figsize=(8, 6))
-    plt.plot([x * SIMULATION_TIME_STEP for x in range(len(relative_distance))], relative_distance, marker='o')
-    plt.xlabel('Time Step')
-    plt.ylabel('Relative Distance (m)')
-    plt.title('Relative Distance')
-    plt.grid()
-    plt.show()
-
-def animate_verdicts(data):
-    # Extract verdicts
-    bbox_top_left_x = [row['bbox_top_left_x'] for row in data]
-    bbox_top_left_y = [row['bbox_top_left_y'] for row in data]
-
-    bbox_top_right_x = [row['bbox_top_right_x'] for row in data]
-    bbox_top_right_y = [row['bbox_top_right_y'] for row in data]
-
-    bbox_bottom_left_x = [row['bbox_bottom_left_x'] for row in data]
-    bbox_bottom_left_y = [row['bbox_bottom_left_y'] for row in data]
-
-    bbox_bottom_right_x = [row['bbox_bottom_right_x'] for row in data]
-    bbox_bottom_right_y = [row['bbox_bottom_right_y'] for row in data]
-
-    fig, ax = plt.subplots(figsize=(8, 6))
-
-    def update(frame):
-        
-        i = frame
-        ax.clear()
-        ax.scatter(bbox_top_left_x[i], bbox_top_left_y[i], c='r')
-        ax.scatter(bbox_top_right_x[i], bbox_top_right_y[i], c='r')
-        ax.scatter(bbox_bottom_left_x[i], bbox_bottom_left_y[i], c='r')
-        ax.scatter(bbox_bottom_right_x[i], bbox_bottom_right_y[i], c='r')
-
-        ax.set_xlabel('X')
-        ax.set_ylabel('Y')
-        ax.set_title(f'iteration {i}')
-        ax.grid()
-
-    ani = FuncAnimation(fig, update, frames=len(bbox_top_left_x), repeat=False)
-    ani.save('verdicts.gif', writer='Pillow', fps=30)
-    plt.show()
+        header = csvfile.readline().strip().split(',')
+        dtype = np.dtype([(name, np.float64) for name in header])
+        data = np.loadtxt(csvfile, delimiter=',', dtype=dtype, ndmin=1)
+    return data
+
+def read_npz(filename):
+    # Load a columnar telemetry archive, one NumPy array per column, without the box table
+    if is_interrupted_npz(filename):
+        table, _ = read_npz_parts(filename)
+        data = np.empty(len(table), dtype=np.dtype([(name, np.float64) for name in TELEMETRY_FIELDS]))
+        for i, name in enumerate(TELEMETRY_FIELDS):
+            data[name] = table[:, i]
+        return data
+
+    with np.load(filename) as archive:
+        names = [name for name in archive.files if not name.startswith(BOX_PREFIX)]
+        data = np.empty(len(archive[names[0]]), dtype=np.dtype([(name, np.float64) for name in names]))
+        for name in names:
+            data[name] = archive[name]
+    return data
+
+def is_interrupted_npz(filename):
+    # A run killed before the writer closed has its flushed rows in the parts directory and no archive
+    return not os.path.exists(filename) and os.path.isdir(npz_parts_dir(filename))
+
+def read_boxes(filename):
+    # Load the boxes of all the targets of a run, one record per box in BOX_FIELDS order, sorted by row.
+    # The boxes of telemetry row i are boxes[np.searchsorted(boxes['row'], i):np.searchsorted(boxes['row'], i, 'right')]
+    if os.path.splitext(filename)[1].lower() == '.npz':
+        if is_interrupted_npz(filename):
+            _, table = read_npz_parts(filename)
+            boxes = np.empty(len(table), dtype=BOX_DTYPE)
+            for i, name in enumerate(BOX_FIELDS):
+                boxes[name] = table[:, i]
+            return boxes
+        with np.load(filename) as archive:
+            if BOX_PREFIX + 'row' not in archive.files:
+                return np.empty(0, dtype=BOX_DTYPE)
+            boxes = np.empty(len(archive[BOX_PREFIX + 'row']), dtype=BOX_DTYPE)
+            for name in BOX_FIELDS:
+                boxes[name] = archive[BOX_PREFIX + name]
+        return boxes
+
+    filename = box_filename(filename)
+    if not os.path.exists(filename):
+        return np.empty(0, dtype=BOX_DTYPE)
+    return np.loadtxt(filename, delimiter=',', skiprows=1, dtype=BOX_DTYPE, ndmin=1)
+
+def time_axis(data, time_step=SIMULATION_TIME_STEP):
+    return np.arange(len(data)) * time_step
+
+def vector(data, prefix):
+    # Stack the x, y, z columns of a signal into an (N, 3) array
+    return np.column_stack([data[f'{prefix}_{axis}'] for axis in 'xyz'])
+
+def bbox_corners(data):
+    # Stack the bounding box corners into an (N, 4, 2) array, in BBOX_CORNERS order
+    return np.stack([np.column_stack((data[f'bbox_{corner}_x'], data[f'bbox_{corner}_y'])) for corner in BBOX_CORNERS], axis=1)
+
+STATE_PLOTS = (
+    ('velocity_y', 'Velocity (m/s)', 'Velocity in Y direction'),
+    ('acceleration_y', 'Acceleration (m/s^2)', 'Acceleration in Y direction'),
+    ('jerk_y', 'Jerk (m/s^3)', 'Jerk in Y direction'),
+    ('relative_distance', 'Relative Distance (m)', 'Relative Distance'),
+)
+
+def plot_state(data, time=None, output_dir=None, prefix=''):
+    # Show the plots interactively, or save them as PNG files when output_dir is given
+    if time is None:
+        time = time_axis(data)
+
+    for column, ylabel, title in STATE_PLOTS:
+        figure = plt.figure(figsize=(8, 6))
+        plt.plot(time, data[column], marker='o')
+        plt.xlabel('Time Step')
+        plt.ylabel(ylabel)
+        plt.title(title)
+        plt.grid()
+        if output_dir is None:
+            plt.show()
+        else:
+            figure.savefig(os.path.join(output_dir, f'{prefix}{column}.png'))
+            plt.close(figure)
+
+def compute_metrics(data, time_step=SIMULATION_TIME_STEP):
+    # CCR metrics of a single run, all computed on whole columns
+    relative_distance = data['relative_distance']
+    velocity = vector(data, 'velocity')
+    ego_speed = np.linalg.norm(velocity, axis=1)
+
+    # Longitudinal acceleration is the acceleration projected on the direction of travel
+    moving = ego_speed > STOP_SPEED_THRESHOLD
+    direction = np.zeros_like(velocity)
+    direction[moving] = velocity[moving] / ego_speed[moving, None]
+    longitudinal_acceleration = np.einsum('ij,ij->i', vector(data, 'acceleration'), direction)
+    jerk = np.linalg.norm(vector(data, 'jerk'), axis=1)
+
+    metrics = {
+        'samples': len(data),
+        'min_relative_distance': float(relative_distance.min()) if len(data) else np.nan,
+        'stop_distance': np.nan,
+        'peak_deceleration': float(max(-longitudinal_acceleration.min(), 0.0)) if len(data) else np.nan,
+        'peak_jerk': float(jerk.max()) if len(data) else np.nan,
+        'time_to_stop': np.nan,
+    }
+
+    # Stop is the first standstill sample after the peak speed, time to stop is measured from the peak speed
+    if len(data) and moving.any():
+        peak = int(np.argmax(ego_speed))
+        stopped = np.flatnonzero(~moving[peak:])
+        if len(stopped):
+            stop = peak + int(stopped[0])
+            metrics['stop_distance'] = float(relative_distance[stop])
+            metrics['time_to_stop'] = (stop - peak) * time_step
+
+    return metrics
+
+class BatchMetrics(object):
+    # Streaming version of compute_metrics for N runs stepped in lockstep, without keeping the time series.
+    # Call update once per time step with the per-run signals, result returns one array per metric.
+
+    def __init__(self, n, time_step=SIMULATION_TIME_STEP):
+        self.time_step = time_step
+        self.samples = 0
+        self.min_relative_distance = np.full(n, np.inf)
+        self.peak_deceleration = np.zeros(n)
+        self.peak_jerk = np.zeros(n)
+        self.peak_speed = np.full(n, -np.inf)
+        self.peak_index = np.zeros(n, dtype=np.int64)
+        self.stop_index = np.full(n, -1, dtype=np.int64)
+        self.stop_distance = np.full(n, np.nan)
+        self.moved = np.zeros(n, dtype=bool)
+
+    def update(self, relative_distance, speed, longitudinal_acceleration, jerk):
+        moving = speed > STOP_SPEED_THRESHOLD
+        self.moved |= moving
+
+        np.minimum(self.min_relative_distance, relative_distance, out=self.min_relative_distance)
+        np.maximum(self.peak_deceleration, np.where(moving, -longitudinal_acceleration, 0.0), out=self.peak_deceleration)
+        np.maximum(self.peak_jerk, np.abs(jerk), out=self.peak_jerk)
+
+        # A new peak speed restarts the search for the stop, as argmax does on the whole run
+        new_peak = speed > self.peak_speed
+        self.peak_speed[new_peak] = speed[new_peak]
+        self.peak_index[new_peak] = self.samples
+        self.stop_index[new_peak] = -1
+
+        stopping = ~moving & (self.stop_index < 0)
+        self.stop_index[stopping] = self.samples
+        self.stop_distance[stopping] = relative_distance[stopping]
+
+        self.samples += 1
+
+    def result(self):
+        stopped = self.moved & (self.stop_index >= 0)
+        return {
+            'samples': np.full(len(self.moved), self.samples),
+            'min_relative_distance': self.min_relative_distance.copy(),
+            'stop_distance': np.where(stopped, self.stop_distance, np.nan),
+            'peak_deceleration': self.peak_deceleration.copy(),
+            'peak_jerk': self.peak_jerk.copy(),
+            'time_to_stop': np.where(stopped, (self.stop_index - self.peak_index) * self.time_step, np.nan),
+        }
+
+def analyze_run(run_filename, plot_dir=None, time_step=SIMULATION_TIME_STEP):
+    # Worker entry point, never opens a window. The plots are saved in plot_dir, which must be unique to the run
+    plt.switch_backend('Agg')
+    data = read_data(run_filename)
+    metrics = compute_metrics(data, time_step)
+    metrics['run'] = run_filename
+
+    if plot_dir is not None:
+        os.makedirs(plot_dir, exist_ok=True)
+        plot_state(data, time_axis(data, time_step), output_dir=plot_dir)
+
+    return metrics
+
+def run_plot_dirs(runs, plot_dir):
+    # One plot directory per run, its path relative to the common root of the runs with the extension
+    # folded in, so runs/a/data.csv and runs/b/data.csv, or t.csv and t.npz, never share their plots
+    root = os.path.commonpath([os.path.dirname(os.path.abspath(run)) for run in runs])
+    plot_dirs = []
+    for run in runs:
+        stem, extension = os.path.splitext(os.path.relpath(os.path.abspath(run), root))
+        plot_dirs.append(os.path.join(plot_dir, f'{stem}_{extension[1:]}'))
+    return plot_dirs
+
+def find_runs(patterns):
+    # Expand directories and glob patterns into a sorted list of run files
+    parts_suffix = npz_parts_dir('')
+    runs = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            for extension in RUN_EXTENSIONS + (parts_suffix,):
+                runs.update(glob.glob(os.path.join(pattern, '**', f'*{extension}'), recursive=True))
+        else:
+            runs.update(path for path in glob.glob(pattern, recursive=True) if path.endswith(RUN_EXTENSIONS + (parts_suffix,)))
+    # Interrupted NPZ runs only have their parts directory, they are read through the archive name
+    runs = {run[:-len(parts_suffix)] if run.endswith(parts_suffix) else run for run in runs}
+    # The box tables written next to the CSV runs are not runs
+    return sorted(run for run in runs if not run.endswith(f'_{BOX_PREFIX[:-1]}.csv'))
+
+def analyze_runs(runs, plot_dir=None, workers=None, time_step=SIMULATION_TIME_STEP):
+    plot_dirs = [None] * len(runs) if plot_dir is None or not runs else run_plot_dirs(runs, plot_dir)
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(analyze_run, run, run_plot_dir, time_step) for run, run_plot_dir in zip(runs, plot_dirs)]
+        summary = []
+        for run, future in zip(runs, futures):
+            try:
+                summary.append(future.result())
+            except Exception as e:
+                logging.error(f'failed to analyze {run}: {e}')
+    return summary
+
+def write_summary(summary, output):
+    with open(output, 'w', newline='') as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=METRIC_FIELDS)
+        writer.writeheader()
+        writer.writerows(summary)
+
+def print_summary(summary):
+    rows = [METRIC_FIELDS] + [tuple(row['run'] if field == 'run' else f'{row[field]:.3f}' if isinstance(row[field], float) else str(row[field]) for field in METRIC_FIELDS) for row in summary]
+    widths = [max(len(row[i]) for row in rows) for i in range(len(METRIC_FIELDS))]
+    for row in rows:
+        print('  '.join(value.ljust(width) for value, width in zip(row, widths)))
+
+VERDICT_FIGSIZE = (8, 6)  # inches
+VERDICT_DPI = 100
+# Raw RGB frames sent to ffmpeg are 1.4 MB each: bound the bytes of the chunks in flight, not only their number
+MAX_PENDING_BYTES = 256 * 1024 ** 2
+MIN_RGB_CHUNK_SIZE = 8  # frames, smaller chunks spend more time on the figure setup than on the rendering
+
+def verdict_palette():
+    # Fixed GIF palette shared by all the frames and all the workers: web-safe colors plus a gray ramp
+    colors = [(r, g, b) for r in range(0, 256, 51) for g in range(0, 256, 51) for b in range(0, 256, 51)]
+    colors += [(v, v, v) for v in np.linspace(0, 255, 256 - len(colors)).astype(int)]
+    palette = Image.new('P', (1, 1))
+    palette.putpalette([channel for color in colors for channel in color])
+    return palette
+
+def verdict_limits(corners, margin=0.05):
+    # Fixed axis limits over the whole run, so the artists can be updated in place
+    low = np.nanmin(corners.reshape(-1, 2), axis=0)
+    high = np.nanmax(corners.reshape(-1, 2), axis=0)
+    pad = np.maximum((high - low) * margin, 1.0)
+    return (low[0] - pad[0], high[0] + pad[0]), (low[1] - pad[1], high[1] + pad[1])
+
+def render_verdict_frames(corners, start, limits, encoding='rgb', duration=None):
+    # Worker entry point: render the frames of one chunk on an Agg canvas with blitting.
+    # Returns one bytes object per frame, raw RGB for a video pipe or an encoded GIF frame.
+    plt.switch_backend('Agg')
+    fig, ax = plt.subplots(figsize=VERDICT_FIGSIZE, dpi=VERDICT_DPI)
+    ax.set_xlim(*limits[0])
+    ax.set_ylim(*limits[1])
+    ax.set_xlabel('X')
+    ax.set_ylabel('Y')
+    ax.grid()
+    points = ax.scatter(corners[0, :, 0], corners[0, :, 1], c='r', animated=True)
+    title = ax.set_title('', animated=True)
+
+    # Draw the static parts once and restore them before every frame
+    fig.canvas.draw()
+    background = fig.canvas.copy_from_bbox(fig.bbox)
+    palette = verdict_palette() if encoding == 'gif' else None
+
+    frames = []
+    for i, frame_corners in enumerate(corners, start):
+        fig.canvas.restore_region(background)
+        points.set_offsets(frame_corners)
+        title.set_text(f'iteration {i}')
+        ax.draw_artist(points)
+        ax.draw_artist(title)
+
+        rgb = np.asarray(fig.canvas.buffer_rgba())[:, :, :3]
+        if encoding == 'gif':
+            image = Image.fromarray(rgb).quantize(palette=palette, dither=Image.Dither.NONE)
+            frames.append(b''.join(GifImagePlugin.getdata(image, duration=duration)))
+        else:
+            frames.append(rgb.tobytes())
+
+    plt.close(fig)
+    return frames
+
+def ordered_results(executor, fn, jobs, max_pending):
+    # Submit the jobs in order and yield their results in the same order, with at most max_pending in flight
+    pending = collections.deque()
+    for args in jobs:
+        pending.append(executor.submit(fn, *args))
+        if len(pending) >= max_pending:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+def animate_verdicts(data, output='verdicts.gif', fps=30, workers=None, chunk_size=64):
+    # Render the bounding box corners of every frame into a GIF (or a video through ffmpeg) in parallel.
+    # The frames are split into chunks rendered by worker processes and streamed to the encoder in order,
+    # so the memory holds a few chunks whatever the length of the run. The raw RGB chunks of the video path
+    # are shrunk and fewer are in flight, so they stay around MAX_PENDING_BYTES whatever the number of workers.
+    corners = bbox_corners(data)
+    if not len(corners):
+        logging.warning('no frames to animate.')
+        return
+
+    limits = verdict_limits(corners)
+    gif = os.path.splitext(output)[1].lower() == '.gif'
+    width, height = (int(size * VERDICT_DPI) for size in VERDICT_FIGSIZE)
+    duration = int(round(1000 / fps))
+
+    if gif:
+        encoder = open(output, 'wb')
+        # The global header carries the shared palette, every frame is then appended as it arrives
+        header = Image.new('P', (width, height))
+        header.putpalette(verdict_palette().getpalette())
+        encoder.write(b''.join(GifImagePlugin.getheader(header, info={'loop': 0})[0]))
+    else:
+        if shutil.which('ffmpeg') is None:
+            raise RuntimeError(f'ffmpeg is needed to encode {output}, use a .gif output instead')
+        process = subprocess.Popen(['ffmpeg', '-y', '-loglevel', 'error', '-f', 'rawvideo', '-pix_fmt', 'rgb24', '-s', f'{width}x{height}', '-r', str(fps), '-i', '-', '-pix_fmt', 'yuv420p', output], stdin=subprocess.PIPE)
+        encoder = process.stdin
+
+    workers = workers or os.cpu_count() or 1
+    max_pending = 2 * workers
+    if not gif:
+        frame_bytes = width * height * 3
+        chunk_size = min(chunk_size, max(MAX_PENDING_BYTES // (max_pending * frame_bytes), MIN_RGB_CHUNK_SIZE))
+        max_pending = max(min(max_pending, MAX_PENDING_BYTES // (chunk_size * frame_bytes)), 1)
+
+    jobs = ((corners[i:i + chunk_size], i, limits, 'gif' if gif else 'rgb', duration) for i in range(0, len(corners), chunk_size))
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for frames in ordered_results(executor, render_verdict_frames, jobs, max_pending=max_pending):
+                encoder.writelines(frames)
+        if gif:
+            encoder.write(b';')  # GIF trailer
+    except BaseException:
+        # Flushing into a dead ffmpeg raises BrokenPipeError, it must not hide the original error
+        with contextlib.suppress(OSError):
+            encoder.close()
+        if not gif:
+            process.wait()
+        raise
+
+    try:
+        encoder.close()
+    finally:
+        returncode = 0 if gif else process.wait()
+    if returncode != 0:
+        raise RuntimeError(f'ffmpeg failed to encode {output}')
+
+    logging.info(f'{len(corners)} frames written to {output}')
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Plot a single CCR run, or summarize many runs in batch mode.')
+    parser.add_argument('runs', nargs='*', help='run files, directories or glob patterns (batch mode)')
+    parser.add_argument('--output', default='summary.csv', help='summary table written in batch mode')
+    parser.add_argument('--plots', default=None, metavar='DIR', help='save PNG plots of every run into DIR')
+    parser.add_argument('--workers', type=int, default=None, help='number of worker processes')
+    parser.add_argument('--time-step', type=float, default=SIMULATION_TIME_STEP, help='simulation time step in seconds')
+    parser.add_argument('--animate', default=None, metavar='FILE', help='single run mode: also render the bounding box corners into FILE (.gif, or a video format through ffmpeg)')
+    return parser.parse_args()
 
 def main():
-    data = read_data(filename)
-    plot_state(data)
-    # animate_verdicts(data)
+    args = parse_args()
+
+    if not args.runs:
+        data = read_data(filename)
+        if args.animate is not None:
+            animate_verdicts(data, args.animate, workers=args.workers)
+        plot_state(data, time_axis(data, args.time_step))
+        return
+
+    runs = find_runs(args.runs)
+    if not runs:
+        logging.error('no run files found.')
+        return
+
+    summary = analyze_runs(runs, plot_dir=args.plots, workers=args.workers, time_step=args.time_step)
+    write_summary(summary, args.output)
+    print_summary(summary)
+    logging.info(f'{len(summary)}/{len(runs)} runs summarized in {args.output}')
 
 if __name__ == '__main__':
+    logging.basicConfig(format='%(levelname)s: %(message)s', level=logging.INFO)
     main()
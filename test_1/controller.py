@@ -1,9 +1,10 @@
 import carla
+import numpy as np
 
 class Controller():
     
     @staticmethod
-    def range_controller(relative_distance: float, current_speed: float, desired_range: float = 1, kt_p: float = 0.1, kt_d: float = 0.05, kb_p:float = 0.05) -> carla.VehicleControl:
+    def range_controller(relative_distance: float, current_speed: float, desired_range: float = 1, kt_p: float = 0.1, kt_d: float = 0.05, kb_p:float = 0.05, target_speed: float = None) -> carla.VehicleControl:
 
         """
         Generates vehicle control commands based on the relative distance to a leading vehicle.
@@ -18,6 +19,7 @@ class Controller():
             kt_p (float, optional): Proportional gain for throttle control. Defaults to 0.1.
             kt_d (float, optional): Derivative gain for throttle control. Defaults to 0.05.
             kb_p (float, optional): Proportional gain for brake control. Defaults to 0.05.
+            target_speed (float, optional): Speed in m/s the ego vehicle holds while far from the leading vehicle. Defaults to None (full throttle).
 
         Returns:
             carla.VehicleControl: The control commands for the ego vehicle.
@@ -31,7 +33,7 @@ class Controller():
         """
 
         if relative_distance > 50.0:
-            req_throttle = 1.0
+            req_throttle = 1.0 if target_speed is None or current_speed < target_speed else 0.0
             req_brake = 0.0
         else:
             req_throttle =  kt_p * ((relative_distance - desired_range) / 100.0) + kt_d * (current_speed - 0.0)
@@ -44,3 +46,47 @@ class Controller():
 
         control = carla.VehicleControl(throttle=req_throttle, steer=0.0, brake=req_brake, hand_brake=False, reverse=False, manual_gear_shift=False)
         return control
+
+    @staticmethod
+    def range_controller_batch(relative_distance: np.ndarray, current_speed: np.ndarray, desired_range: np.ndarray = 1, kt_p: np.ndarray = 0.1, kt_d: np.ndarray = 0.05, kb_p: np.ndarray = 0.05, target_speed: np.ndarray = None) -> tuple[np.ndarray, np.ndarray]:
+
+        """
+        Array version of range_controller for N scenarios stepped in lockstep.
+
+        Args:
+            relative_distance (np.ndarray): Relative distances to the leading vehicles in meters, shape (N,).
+            current_speed (np.ndarray): Current speeds of the ego vehicles in m/s, shape (N,).
+            desired_range (np.ndarray, optional): Desired ranges in meters, scalar or shape (N,). Defaults to 1.
+            kt_p (np.ndarray, optional): Proportional gains for throttle control, scalar or shape (N,). Defaults to 0.1.
+            kt_d (np.ndarray, optional): Derivative gains for throttle control, scalar or shape (N,). Defaults to 0.05.
+            kb_p (np.ndarray, optional): Proportional gains for brake control, scalar or shape (N,). Defaults to 0.05.
+            target_speed (np.ndarray, optional): Cruise speeds in m/s, NaN (or None for all) means full throttle. Defaults to None.
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]: The throttle and brake commands, shape (N,) each.
+
+        The commands are the same as range_controller element-wise, before they are packed into a carla.VehicleControl.
+
+        Example:
+            throttle, brake = Controller.range_controller_batch(np.array([80.0, 10.0]), np.array([15.0, 12.0]), kt_p=np.array([0.5, 0.6]))
+        """
+
+        relative_distance = np.asarray(relative_distance, dtype=np.float64)
+        current_speed = np.asarray(current_speed, dtype=np.float64)
+
+        if target_speed is None:
+            cruise_throttle = 1.0
+        else:
+            target_speed = np.asarray(target_speed, dtype=np.float64)
+            cruise_throttle = np.where(np.isnan(target_speed) | (current_speed < target_speed), 1.0, 0.0)
+
+        req_throttle = kt_p * ((relative_distance - desired_range) / 100.0) + kt_d * (current_speed - 0.0)
+        req_brake = kb_p * (1 - req_throttle)
+
+        far = relative_distance > 50.0
+        req_throttle = np.where(far, cruise_throttle, req_throttle)
+        req_brake = np.where(far, 0.0, req_brake)
+
+        req_throttle = np.where(req_throttle > 1.0, 1.0, np.where(req_throttle < 0.1, 0.0, req_throttle))
+
+        return req_throttle, req_brake
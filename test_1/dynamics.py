@@ -1,5 +1,30 @@
 import carla
 import numpy as np
+
+JERK_FILTERS = ('moving_average', 'exponential', 'savgol')
+
+
+def savgol_coefficients(window_size: int, polyorder: int) -> np.ndarray:
+    """
+    Weights of a causal Savitzky-Golay filter, evaluated at the newest sample of the window.
+
+    Args:
+        window_size (int): Number of samples of the window.
+        polyorder (int): Order of the polynomial fitted on the window, lower than window_size.
+
+    Returns:
+        np.ndarray: The weights of shape (window_size,), oldest sample first.
+
+    Example:
+        weights = savgol_coefficients(5, 2)
+        filtered = weights @ samples  # samples of shape (5,), oldest first
+    """
+    t = np.arange(1 - window_size, 1, dtype=np.float64)
+    vandermonde = np.vander(t, polyorder + 1, increasing=True)
+    # The constant term of the least squares fit is the value of the polynomial at t = 0
+    return np.linalg.pinv(vandermonde)[0]
+
+
 class Dynamics():
 
     """
@@ -7,10 +32,15 @@ class Dynamics():
 
     This class encapsulates methods for computing various vehicle dynamics properties,
     such as position, velocity, acceleration, jerk, and relative distance.
+    Every method also accepts an actor_state.ActorState in place of the vehicle, which reads the
+    values of the current frame without a round trip to the server.
 
     Attributes:
         vehicle (carla.Vehicle): The vehicle object for which dynamics are calculated.
         dt (float): Time interval for calculating jerk.
+        filter_type (str): Acceleration filter of the jerk, one of JERK_FILTERS.
+        filter_window_size (int): Number of samples of the moving average and Savitzky-Golay filters.
+        smoothing (float): Weight of the newest sample in the exponential filter, in (0, 1].
 
     Methods:
         __init__: Initializes a new Dynamics object.
@@ -30,14 +60,27 @@ class Dynamics():
         relative_distance = dynamics.get_ground_truth_relative_distance(another_vehicle)  # Get the relative distance to another vehicle
     """
 
-    def __init__(self, vehicle, dt=0.05):
+    def __init__(self, vehicle, dt=0.05, filter_type='moving_average', filter_window_size=5, smoothing=0.5, polyorder=2):
+        if filter_type not in JERK_FILTERS:
+            raise ValueError(f'unknown filter type {filter_type!r}, expected one of {JERK_FILTERS}')
+        if filter_type == 'savgol' and polyorder >= filter_window_size:
+            raise ValueError('the Savitzky-Golay polynomial order must be lower than the window size')
+
         self.vehicle = vehicle
         self.acceleration = self.get_acceleration(self.vehicle)
         self.dt = dt
+        self.filter_type = filter_type
+        self.filter_window_size = filter_window_size
+        self.smoothing = smoothing
         self.previous_acceleration = None
-        self.filter_window_size = 5  
-        self.acceleration_history = {"x": [], "y": [], "z": []}
-    
+
+        # Fixed ring buffer of the last filter_window_size (x, y, z) samples and their running sum
+        self._history = [(0.0, 0.0, 0.0)] * filter_window_size
+        self._index = 0
+        self._count = 0
+        self._sum = [0.0, 0.0, 0.0]
+        self._savgol_coefficients = savgol_coefficients(filter_window_size, polyorder).tolist() if filter_type == 'savgol' else None
+
     @staticmethod
     def get_positon(vehicle: carla.Vehicle) -> carla.Location:
         """
@@ -137,10 +180,14 @@ class Dynamics():
             list[float]: List containing the jerk components [jerk_x, jerk_y, jerk_z].
 
         This method calculates the jerk (the rate of change of acceleration) of a vehicle
-        using a moving average filter to smooth out noisy acceleration data.
+        from a filtered acceleration, to smooth out noisy acceleration data:
 
-        The function appends the current acceleration to a history buffer and then computes
-        the moving average acceleration over a specified window size. The jerk is then
+        - 'moving_average': mean of the last filter_window_size samples, kept as a running sum.
+        - 'exponential': exponential moving average with weight `smoothing` on the newest sample.
+        - 'savgol': causal Savitzky-Golay filter of order `polyorder` over the last filter_window_size samples.
+
+        The samples are kept in a fixed ring buffer, so memory and time per call stay constant over
+        long runs. The raw acceleration is used until the window is full. The jerk is then
         calculated as the difference between the current filtered acceleration and the
         previous filtered acceleration, divided by the time step.
 
@@ -153,25 +200,12 @@ class Dynamics():
             print(jerk)  # Output: [0.5, 0.2, -0.1] (example values)
         """
         current_acceleration = self.get_acceleration(vehicle)
-
-        # Append current acceleration to the history
-        self.acceleration_history["x"].append(current_acceleration.x)
-        self.acceleration_history["y"].append(current_acceleration.y)
-        self.acceleration_history["z"].append(current_acceleration.z)
-
-        # Apply the moving average filter to each axis
-        filtered_acceleration = current_acceleration
-        if all(len(self.acceleration_history[axis]) >= self.filter_window_size for axis in ["x", "y", "z"]):
-            filtered_acceleration = carla.Vector3D(
-                x=np.mean(self.acceleration_history["x"][-self.filter_window_size:]),
-                y=np.mean(self.acceleration_history["y"][-self.filter_window_size:]),
-                z=np.mean(self.acceleration_history["z"][-self.filter_window_size:])
-            )
+        filtered_acceleration = self._filter((current_acceleration.x, current_acceleration.y, current_acceleration.z))
 
         # Calculate jerk
         jerk = [0, 0, 0]
         if self.previous_acceleration is not None:
-            jerk = [(getattr(filtered_acceleration, axis) - getattr(self.previous_acceleration, axis)) / self.dt for axis in ["x", "y", "z"]]
+            jerk = [(filtered - previous) / self.dt for filtered, previous in zip(filtered_acceleration, self.previous_acceleration)]
 
         # Update previous acceleration
         self.previous_acceleration = filtered_acceleration
@@ -180,4 +214,91 @@ class Dynamics():
 
         return saturated_jerk
 
-        
\ No newline at end of file
+    def _filter(self, sample: tuple[float, float, float]) -> tuple[float, float, float]:
+        if self.filter_type == 'exponential':
+            if self.previous_acceleration is None:
+                return sample
+            return tuple(previous + self.smoothing * (value - previous) for value, previous in zip(sample, self.previous_acceleration))
+
+        # Overwrite the oldest sample of the ring buffer
+        oldest = self._history[self._index]
+        self._history[self._index] = sample
+        self._index = (self._index + 1) % self.filter_window_size
+        self._count += 1
+
+        if self._index == 0:
+            # Resum the window once per turn of the ring so rounding errors do not accumulate
+            self._sum = [sum(values) for values in zip(*self._history)]
+        else:
+            self._sum = [total + value - old for total, value, old in zip(self._sum, sample, oldest)]
+
+        if self._count < self.filter_window_size:
+            return sample
+
+        if self.filter_type == 'moving_average':
+            return tuple(total / self.filter_window_size for total in self._sum)
+
+        # Savitzky-Golay, the oldest sample is at the write index
+        ordered = self._history[self._index:] + self._history[:self._index]
+        return tuple(sum(weight * value for weight, value in zip(self._savgol_coefficients, values)) for values in zip(*ordered))
+
+
+class BatchDynamics():
+
+    """
+    Array version of Dynamics.get_jerk for N scenarios stepped in lockstep.
+
+    The acceleration samples of every step are kept in a fixed (window, ...) array instead of per-axis
+    Python lists, and the jerk of all the scenarios is computed with a few NumPy operations.
+
+    Attributes:
+        dt (float): Time interval for calculating jerk.
+        filter_window_size (int): Number of samples of the moving average filter.
+        max_jerk (float): Bound of the jerk values.
+
+    Example:
+        batch = BatchDynamics(dt=0.05)
+        jerk = batch.get_jerk(acceleration)  # acceleration of shape (N,) or (N, 3)
+    """
+
+    def __init__(self, dt=0.05, filter_window_size=5, max_jerk=10.0):
+        self.dt = dt
+        self.filter_window_size = filter_window_size
+        self.max_jerk = max_jerk
+        self.previous_acceleration = None
+        self._history = None
+        self._count = 0
+
+    def get_jerk(self, acceleration: np.ndarray) -> np.ndarray:
+        """
+        Calculate the jerk of N scenarios from their current acceleration.
+
+        Args:
+            acceleration (np.ndarray): Current accelerations, any shape, the same on every call.
+
+        Returns:
+            np.ndarray: The saturated jerk, with the same shape as acceleration.
+
+        Same filter as the default moving average of Dynamics.get_jerk: the raw acceleration is used until the window is full,
+        then the moving average of the last filter_window_size samples.
+        """
+        acceleration = np.asarray(acceleration, dtype=np.float64)
+        if self._history is None:
+            self._history = np.zeros((self.filter_window_size,) + acceleration.shape)
+
+        self._history[self._count % self.filter_window_size] = acceleration
+        self._count += 1
+
+        if self._count >= self.filter_window_size:
+            filtered_acceleration = self._history.mean(axis=0)
+        else:
+            filtered_acceleration = acceleration.copy()
+
+        if self.previous_acceleration is None:
+            jerk = np.zeros_like(acceleration)
+        else:
+            jerk = (filtered_acceleration - self.previous_acceleration) / self.dt
+
+        self.previous_acceleration = filtered_acceleration
+
+        return np.clip(jerk, -self.max_jerk, self.max_jerk)
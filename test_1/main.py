@@ -1,32 +1,89 @@
+import argparse
+import collections
+import math
+
 import carla
 import cv2
-import numpy as np
 
+from actor_state import ActorStateCache
 from dynamics import Dynamics
+from pipeline import FramePipeline
+from radar import RadarRangeEstimator
+from recorder import RECORD_FORMATS, FrameRecorder
 from scene import Scene
+from scenario import get_start_poses, resolve_scenario
+from telemetry import make_telemetry_writer
 from controller import Controller
 from visualizer import Visualizer
 
 import logging
 
+# Telemetry output, a `.npz` extension stores the run in the columnar binary format instead of CSV
+TELEMETRY_FILENAME = 'data.csv'
+
+# Relative distance fed to the controller: server-side actor locations, or a forward radar
+RANGE_SOURCES = ('ground_truth', 'radar')
+RADAR_RANGE = 100.0  # m
+
 logging.basicConfig(format='%(levelname)s: %(message)s', level=logging.INFO)
 
-def main():
-    actor_list = []
+def parse_args():
+    parser = argparse.ArgumentParser(description='CCRs scenario: the ego car approaches a stationary car and brakes.')
+    parser.add_argument('--host', default='localhost', help='CARLA server host')
+    parser.add_argument('--port', type=int, default=2000, help='CARLA server port')
+    parser.add_argument('--headless', action='store_true', help='run without camera, display and pygame events, with rendering disabled on the server')
+    parser.add_argument('--frames', type=int, default=None, help='stop after this many simulation frames')
+    parser.add_argument('--pipeline', action='store_true', help='draw and log each frame on a worker thread while the next frame is simulated')
+    parser.add_argument('--record', default=None, metavar='DIR', help='record the camera frames into DIR')
+    parser.add_argument('--record-format', default='jpeg', choices=RECORD_FORMATS, help='format of the recorded frames')
+    parser.add_argument('--telemetry', default=TELEMETRY_FILENAME, metavar='FILE', help='telemetry output file, a .npz extension stores the run in the columnar binary format')
+    parser.add_argument('--range-source', default='ground_truth', choices=RANGE_SOURCES, help='relative distance used by the controller')
+    return parser.parse_args()
+
+def load_town(client: carla.Client, town: str) -> carla.World:
+    # Reuse the loaded world when it is already the requested town, loading a map takes seconds
+    world = client.get_world()
+    if world.get_map().name.split('/')[-1] != town.split('/')[-1]:
+        world = client.load_world(town)
+    return world
+
+def run_scenario(client: carla.Client, telemetry_filename: str = TELEMETRY_FILENAME, headless: bool = False, frames: int = None, fps: int = 30, pipeline: bool = False, recorder: FrameRecorder = None, range_source: str = 'ground_truth', **scenario) -> None:
+    """
+    Run a single CCRs scenario and log its telemetry.
+
+    Args:
+        client (carla.Client): Client connected to the CARLA server.
+        telemetry_filename (str): Telemetry output file, `.npz` selects the columnar binary format.
+        headless (bool): Run without camera sensor, display and pygame events.
+        frames (int): Stop after this many simulation frames, None runs until the user quits.
+        fps (int): Simulation frames per second.
+        pipeline (bool): Draw and log every frame on a worker thread, overlapped with the next tick.
+            The control only depends on the frame snapshot, so it is the same with or without the pipeline.
+            The annotated frames are still shown on the calling thread, HighGUI is not thread-safe.
+        recorder (FrameRecorder, optional): Records the camera frames in the background, unused when headless.
+        range_source (str): Relative distance used by the controller, one of RANGE_SOURCES. With 'radar' the
+            telemetry still logs the ground truth distance, and the radar error and processing time are logged.
+        **scenario: Overrides of DEFAULT_SCENARIO (town, initial_distance, target_speed, ego_blueprint,
+            target_blueprint, desired_range, kt_p, kt_d, kb_p).
+    """
+    scenario = resolve_scenario(**scenario)
+    if range_source not in RANGE_SOURCES:
+        raise ValueError(f'unknown range source {range_source!r}, expected one of {RANGE_SOURCES}')
 
-    client = carla.Client('localhost', 2000)
-    client.set_timeout(5.0)
+    actor_list = []
+    estimator = None
 
-    world = client.load_world('/Game/Carla/Maps/Town02')
+    world = load_town(client, scenario['town'])
 
     try:
-        stationary_start_pose = carla.Transform(carla.Location(x=-7.53, y=170.0, z=0.3), carla.Rotation(pitch=0.0, yaw=-90.0, roll=0.0))
-        ego_start_pose = carla.Transform(carla.Location(x=-7.53, y=275.0, z=0.3), carla.Rotation(pitch=0.0, yaw=-90.0, roll=0.0))
+        stationary_start_pose, ego_start_pose = get_start_poses(scenario['initial_distance'])
 
         # Spawn the vehicles and set their physics
-        stationary_vehicle = Scene.spawn_vehicle(world, 'vehicle.tesla.model3', stationary_start_pose)
-        ego_vehicle = Scene.spawn_vehicle(world, 'vehicle.bmw.grandtourer', ego_start_pose)
-        
+        stationary_vehicle = Scene.spawn_vehicle(world, scenario['target_blueprint'], stationary_start_pose)
+        actor_list.append(stationary_vehicle)
+        ego_vehicle = Scene.spawn_vehicle(world, scenario['ego_blueprint'], ego_start_pose)
+        actor_list.append(ego_vehicle)
+
         stationary_vehicle.set_simulate_physics(False)
         ego_vehicle.set_simulate_physics(True)
 
@@ -34,58 +91,133 @@ def main():
         ego_vehicle_dimensions = Scene.get_vehicle_dimensions(ego_vehicle)
         stationary_vehicle_dimensions = Scene.get_vehicle_dimensions(stationary_vehicle)
 
-        # Spawn the camera
-        camera_front, sensor_front = Scene.spawn_camera(world, ego_vehicle, ego_vehicle_dimensions, view_width=1920, view_height=1080, view_fov=90)
-
-        # Append the actors to the list
-        actor_list.append(stationary_vehicle)
-        actor_list.append(ego_vehicle)
-        actor_list.append(camera_front)
-
         # Create the dynamics and visualizer objects
         state = Dynamics(ego_vehicle, dt=(1/20))
-        visualizer = Visualizer(camera_front, sensor_front)
-
-        # Create a synchronous mode context.
-        with Scene(world, camera_front, fps=30) as sync_mode:
-            while True:
-                if Scene.should_quit():
-                    return
-                visualizer.clock.tick()
+        if headless:
+            # No camera sensor, the bounding box is projected from a virtual camera at the same pose
+            sensors = []
+            sensor_front = Scene.get_camera_blueprint(world, view_width=1920, view_height=1080, view_fov=90)
+            visualizer = Visualizer(None, sensor_front, display=False, parent=ego_vehicle, camera_transform=Scene.get_camera_transform(ego_vehicle_dimensions))
+        else:
+            # Spawn the camera
+            camera_front, sensor_front = Scene.spawn_camera(world, ego_vehicle, ego_vehicle_dimensions, view_width=1920, view_height=1080, view_fov=90)
+            actor_list.append(camera_front)
+            sensors = [camera_front]
+            visualizer = Visualizer(camera_front, sensor_front)
+
+        if range_source == 'radar':
+            # The radar is the last sensor, its range starts 5 cm ahead of the front bumper
+            radar = Scene.spawn_radar(world, ego_vehicle, ego_vehicle_dimensions, radar_range=RADAR_RANGE)
+            actor_list.append(radar)
+            sensors.append(radar)
+            radar_transform = Scene.get_radar_transform(ego_vehicle_dimensions)
+            estimator = RadarRangeEstimator(mount_height=radar_transform.location.z, range_offset=radar_transform.location.x - ego_vehicle_dimensions[0] / 2)
+
+        # Vehicles to box, read once here instead of listing the world actors on every frame
+        traffic = [actor for actor in world.get_actors().filter('*vehicle*') if actor.id not in (ego_vehicle.id, stationary_vehicle.id)]
+        visualizer.track_vehicles([stationary_vehicle, *traffic])
+
+        # Per-tick states of the tracked actors, read once per frame from the world snapshot
+        actor_states = ActorStateCache(world, ego_vehicle, stationary_vehicle, *traffic, *sensors)
+
+        # Buffered telemetry, closed together with the synchronous mode context
+        telemetry = make_telemetry_writer(telemetry_filename, flush_rows=100, flush_interval=1.0)
+
+        def process_frame(image_front, states, relative_distance):
+            # Drawing and logging of a frame, only reads the frame snapshot so it can run behind the simulation
+            ego_state = states[ego_vehicle.id]
+
+            # Draw the display, on the worker thread the frame is shown by the main loop (HighGUI is not thread-safe)
+            frame = visualizer.draw_bbox(image_front, world, ego_state, relative_distance, states=states, show=not pipeline)
+
+            # log the necessary data
+            velocity = state.get_velocity(ego_state)
+            acceleration = state.get_acceleration(ego_state)
+            jerk = state.get_jerk(ego_state)
+            verdicts = visualizer.get_bbox_vertices()
+            telemetry.write(velocity, acceleration, jerk, relative_distance, verdicts, boxes=visualizer.get_bboxes())
+
+            # The frame buffer is reused by the next frame while the main loop shows this one
+            return frame.copy() if pipeline and frame is not None else None
+
+        # Create a synchronous mode context, the pipeline is drained before the telemetry is closed.
+        with Scene(world, *sensors, fps=fps, telemetry=telemetry, recorder=recorder, no_rendering_mode=headless) as sync_mode, FramePipeline(max_pending=2, enabled=pipeline) as frame_pipeline:
+            frame_count = 0
+            # Frames drawn on the worker thread, shown in order on the main thread once done
+            drawn_frames = collections.deque()
+            while frames is None or frame_count < frames:
+                frame_count += 1
+                if not headless:
+                    if Scene.should_quit():
+                        return
+                    visualizer.clock.tick()
 
                 # Advance the simulation and wait for the data.
-                _, image_front = sync_mode.tick(timeout=2.0)
+                data = sync_mode.tick(timeout=2.0)
+                image_front = None if headless else data[1]
+
+                # Read the actors once from the snapshot of this frame
+                states = actor_states.update(data[0])
+                ego_state = states[ego_vehicle.id]
 
                 # get the relative distance between the two vehicles
-                relative_distance = state.get_ground_truth_relative_distance(ego_vehicle, stationary_vehicle, ego_vehicle_dimensions, stationary_vehicle_dimensions)
+                relative_distance = state.get_ground_truth_relative_distance(ego_state, states[stationary_vehicle.id], ego_vehicle_dimensions, stationary_vehicle_dimensions)
+
+                # Distance seen by the controller
+                control_distance = relative_distance
+                if estimator is not None:
+                    radar_distance, range_rate = estimator.update(data[-1])
+                    # Nothing tracked yet, the lead vehicle is beyond the radar range. A lost track keeps its last estimate
+                    control_distance = estimator.get_control_distance(default=RADAR_RANGE)
+                    logging.debug(f'radar distance {radar_distance:.2f} m (error {radar_distance - relative_distance:+.2f} m), range rate {range_rate:.2f} m/s, {1000.0 * estimator.last_latency:.3f} ms')
 
                 # calculate the control signal
-                speed = np.linalg.norm([state.get_velocity(ego_vehicle).x, state.get_velocity(ego_vehicle).y, state.get_velocity(ego_vehicle).z])
-                control = Controller.range_controller(relative_distance, speed, desired_range=1.0, kt_p=0.56, kt_d=0.015, kb_p=0.75)
+                velocity = state.get_velocity(ego_state)
+                speed = math.sqrt(velocity.x ** 2 + velocity.y ** 2 + velocity.z ** 2)
+                control = Controller.range_controller(control_distance, speed, desired_range=scenario['desired_range'], kt_p=scenario['kt_p'], kt_d=scenario['kt_d'], kb_p=scenario['kb_p'], target_speed=scenario['target_speed'])
 
                 # Apply the control signal to the ego vehicle
                 ego_vehicle.apply_control(control)
 
-                # Draw the display.
-                visualizer.draw_bbox(image_front, world, ego_vehicle, relative_distance)
-
-                # log the necessary data
-                velocity = state.get_velocity(ego_vehicle)
-                acceleration = state.get_acceleration(ego_vehicle)
-                jerk = state.get_jerk(ego_vehicle)
-                verdicts = visualizer.get_bbox_vertices()
-                Scene.save_data_to_csv(velocity, acceleration, jerk, relative_distance, verdicts, 'data.csv')
+                # Draw and log the frame, on the worker thread when the pipeline is enabled
+                drawn = frame_pipeline.submit(process_frame, image_front, states, relative_distance)
+                if pipeline and not headless:
+                    drawn_frames.append(drawn)
+                    frame = None
+                    while drawn_frames and drawn_frames[0].done():
+                        frame = drawn_frames.popleft().result()
+                    if frame is not None:
+                        visualizer.show_frame(frame)
 
                 logging.debug(relative_distance)
     finally:
+        if estimator is not None:
+            stats = estimator.get_latency_stats()
+            logging.info(f'radar: {stats["updates"]} updates, processing {stats["mean_ms"]:.3f} ms mean, {stats["max_ms"]:.3f} ms max')
         logging.info('destroying actors.')
         for actor in actor_list:
             actor.destroy()
-        cv2.destroyAllWindows()
+        if not headless:
+            cv2.destroyAllWindows()
         logging.info('done.')
 
+def main():
+    args = parse_args()
+
+    client = carla.Client(args.host, args.port)
+    client.set_timeout(5.0)
+
+    recorder = None
+    if args.record is not None:
+        if args.headless:
+            logging.warning('--record is ignored in headless mode, there is no camera.')
+        else:
+            recorder = FrameRecorder(args.record, fmt=args.record_format)
+
+    run_scenario(client, args.telemetry, headless=args.headless, frames=args.frames, pipeline=args.pipeline, recorder=recorder, range_source=args.range_source)
+
 if __name__ == '__main__':
     try:
         main()
     except KeyboardInterrupt:
-        logging.info('\nCancelled by user. Bye!')
\ No newline at end of file
+        logging.info('\nCancelled by user. Bye!')
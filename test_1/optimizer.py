@@ -0,0 +1,223 @@
+import argparse
+import csv
+import json
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from scenario import DEFAULT_SCENARIO
+from simulator import run_batch_scenarios
+
+logging.basicConfig(format='%(levelname)s: %(message)s', level=logging.INFO)
+
+GAINS = ('kt_p', 'kt_d', 'kb_p', 'desired_range')
+DEFAULT_BOUNDS = {
+    'kt_p': (0.1, 1.5),
+    'kt_d': (0.0, 0.1),
+    'kb_p': (0.2, 1.5),
+    'desired_range': (0.5, 5.0),
+}
+
+COLLISION_PENALTY = 1000.0
+NO_STOP_PENALTY = 100.0
+
+
+def evaluate(candidates: np.ndarray, frames: int = 600, fps: int = 30, initial_distance: float = DEFAULT_SCENARIO['initial_distance']) -> dict[str, np.ndarray]:
+    """
+    Simulate a block of candidate gains in lockstep.
+
+    Args:
+        candidates (np.ndarray): Candidate gains of shape (N, 4), columns in GAINS order.
+        frames (int): Number of simulation frames.
+        fps (int): Simulation frames per second.
+        initial_distance (float): Initial distance between the two vehicles' centers in meters.
+
+    Returns:
+        dict[str, np.ndarray]: The metrics of run_batch_scenarios with unsaturated jerk, shape (N,) each.
+    """
+    # The jerk is not saturated, otherwise every aggressive candidate would share the same 10 m/s^3 peak
+    return run_batch_scenarios(frames=frames, fps=fps, max_jerk=np.inf, initial_distance=initial_distance, **{name: candidates[:, i] for i, name in enumerate(GAINS)})
+
+
+def cost(metrics: dict[str, np.ndarray], target_gap: float = 1.0, jerk_weight: float = 0.02) -> np.ndarray:
+    """
+    Scalar cost of every candidate, lower is better.
+
+    Args:
+        metrics (dict[str, np.ndarray]): Metrics returned by evaluate.
+        target_gap (float): Desired final gap to the stationary vehicle in meters.
+        jerk_weight (float): Weight of the peak jerk in m/s^3 against the final gap error in meters.
+
+    Returns:
+        np.ndarray: The cost of every candidate. A collision adds COLLISION_PENALTY, and a run that never
+        stops adds NO_STOP_PENALTY instead of a final gap error.
+    """
+    gap_error = np.abs(metrics['stop_distance'] - target_gap)
+    stopped = ~np.isnan(gap_error)
+    collision = metrics['min_relative_distance'] <= 0.0
+    return np.where(stopped, gap_error, NO_STOP_PENALTY) + jerk_weight * metrics['peak_jerk'] + np.where(collision, COLLISION_PENALTY, 0.0)
+
+
+def pareto_front(gap_error: np.ndarray, peak_jerk: np.ndarray) -> np.ndarray:
+    """
+    Indices of the non-dominated candidates for (final gap error, peak jerk), both minimized.
+
+    Args:
+        gap_error (np.ndarray): Final gap errors, shape (N,).
+        peak_jerk (np.ndarray): Peak jerks, shape (N,).
+
+    Returns:
+        np.ndarray: Indices of the Pareto front, sorted by increasing gap error.
+    """
+    order = np.lexsort((peak_jerk, gap_error))
+    jerk_sorted = peak_jerk[order]
+    best_before = np.concatenate(([np.inf], np.minimum.accumulate(jerk_sorted)[:-1]))
+    return order[jerk_sorted < best_before]
+
+
+class GainOptimizer(object):
+
+    """
+    Grid-then-refine search of the range controller gains on the batched simulator.
+
+    The first round evaluates a regular grid over the bounds. Every following round samples new candidates
+    around the best ones with a spread that shrinks each round. Candidates are split into blocks that are
+    simulated concurrently on a process pool, each block as one lockstep NumPy simulation.
+
+    Attributes:
+        bounds (dict): (low, high) of every gain.
+        target_gap (float): Desired final gap in meters.
+        jerk_weight (float): Weight of the peak jerk in the cost.
+        frames (int): Number of simulation frames per candidate.
+        fps (int): Simulation frames per second.
+        workers (int): Number of worker processes, None for one per CPU.
+        block_size (int): Number of candidates simulated together by a worker.
+
+    Methods:
+        run: Run the search and return the evaluated candidates and their metrics.
+
+    Example:
+        optimizer = GainOptimizer(target_gap=1.0)
+        candidates, metrics, costs = optimizer.run(grid_points=8, rounds=4, samples=4096)
+    """
+
+    def __init__(self, bounds: dict = None, target_gap: float = 1.0, jerk_weight: float = 0.02, frames: int = 600, fps: int = 30, initial_distance: float = DEFAULT_SCENARIO['initial_distance'], workers: int = None, block_size: int = 1024, seed: int = 0):
+        self.bounds = {**DEFAULT_BOUNDS, **(bounds or {})}
+        self.target_gap = target_gap
+        self.jerk_weight = jerk_weight
+        self.frames = frames
+        self.fps = fps
+        self.initial_distance = initial_distance
+        self.workers = workers
+        self.block_size = block_size
+        self._rng = np.random.default_rng(seed)
+        self._low = np.array([self.bounds[name][0] for name in GAINS])
+        self._high = np.array([self.bounds[name][1] for name in GAINS])
+
+    def _evaluate(self, executor: ProcessPoolExecutor, candidates: np.ndarray) -> dict[str, np.ndarray]:
+        blocks = [candidates[i:i + self.block_size] for i in range(0, len(candidates), self.block_size)]
+        futures = [executor.submit(evaluate, block, self.frames, self.fps, self.initial_distance) for block in blocks]
+        results = [future.result() for future in futures]
+        return {name: np.concatenate([result[name] for result in results]) for name in results[0]}
+
+    def _grid(self, points: int) -> np.ndarray:
+        axes = [np.linspace(low, high, points) for low, high in zip(self._low, self._high)]
+        return np.stack(np.meshgrid(*axes, indexing='ij'), axis=-1).reshape(-1, len(GAINS))
+
+    def _refine(self, elites: np.ndarray, samples: int, spread: float) -> np.ndarray:
+        parents = elites[self._rng.integers(len(elites), size=samples)]
+        candidates = parents + self._rng.normal(scale=spread * (self._high - self._low), size=parents.shape)
+        return np.clip(candidates, self._low, self._high)
+
+    def run(self, grid_points: int = 8, rounds: int = 4, samples: int = 4096, elite_fraction: float = 0.02, shrink: float = 0.5) -> tuple[np.ndarray, dict[str, np.ndarray], np.ndarray]:
+        """
+        Run the search.
+
+        Args:
+            grid_points (int): Grid points per gain in the first round.
+            rounds (int): Number of refinement rounds after the grid.
+            samples (int): Candidates per refinement round.
+            elite_fraction (float): Fraction of all the candidates evaluated so far used as parents.
+            shrink (float): Factor applied to the sampling spread after each round.
+
+        Returns:
+            tuple[np.ndarray, dict[str, np.ndarray], np.ndarray]: All the evaluated candidates (N, 4),
+            their metrics and their costs.
+        """
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            candidates = self._grid(grid_points)
+            metrics = self._evaluate(executor, candidates)
+            costs = cost(metrics, self.target_gap, self.jerk_weight)
+            logging.info(f'grid: {len(candidates)} candidates, best cost {costs.min():.4f}')
+
+            spread = 0.1
+            for round_index in range(rounds):
+                n_elites = max(int(elite_fraction * len(candidates)), 1)
+                elites = candidates[np.argsort(costs)[:n_elites]]
+
+                new_candidates = self._refine(elites, samples, spread)
+                new_metrics = self._evaluate(executor, new_candidates)
+
+                candidates = np.concatenate((candidates, new_candidates))
+                metrics = {name: np.concatenate((metrics[name], new_metrics[name])) for name in metrics}
+                costs = np.concatenate((costs, cost(new_metrics, self.target_gap, self.jerk_weight)))
+                spread *= shrink
+                logging.info(f'round {round_index + 1}: {len(candidates)} candidates, best cost {costs.min():.4f}')
+
+        return candidates, metrics, costs
+
+
+def write_results(output_dir: str, candidates: np.ndarray, metrics: dict[str, np.ndarray], costs: np.ndarray, target_gap: float) -> None:
+    os.makedirs(output_dir, exist_ok=True)
+
+    # Pareto front of the collision-free runs that stop, on final gap error and peak jerk
+    gap_error = np.abs(metrics['stop_distance'] - target_gap)
+    feasible = np.flatnonzero((metrics['min_relative_distance'] > 0.0) & ~np.isnan(gap_error))
+    front = feasible[pareto_front(gap_error[feasible], metrics['peak_jerk'][feasible])]
+
+    fields = [*GAINS, 'gap_error', 'cost', 'min_relative_distance', 'stop_distance', 'peak_deceleration', 'peak_jerk', 'time_to_stop']
+    with open(os.path.join(output_dir, 'pareto.csv'), 'w', newline='') as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(fields)
+        for i in front:
+            writer.writerow([*candidates[i], gap_error[i], costs[i], *(metrics[name][i] for name in fields[6:])])
+
+    best = int(np.argmin(costs))
+    best_gains = {name: float(candidates[best, i]) for i, name in enumerate(GAINS)}
+    best_gains['cost'] = float(costs[best])
+    best_gains.update({name: float(metrics[name][best]) for name in fields[6:]})
+    with open(os.path.join(output_dir, 'best_gains.json'), 'w') as f:
+        json.dump(best_gains, f, indent=4)
+
+    logging.info(f'{len(front)} Pareto candidates, best gains: ' + ', '.join(f'{name}={best_gains[name]:.4f}' for name in GAINS))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Optimize the range controller gains on the batched NumPy simulator.')
+    parser.add_argument('--grid-points', type=int, default=8, help='grid points per gain in the first round')
+    parser.add_argument('--rounds', type=int, default=4, help='refinement rounds')
+    parser.add_argument('--samples', type=int, default=4096, help='candidates per refinement round')
+    parser.add_argument('--target-gap', type=float, default=1.0, help='desired final gap in meters')
+    parser.add_argument('--jerk-weight', type=float, default=0.02, help='weight of the peak jerk in the cost')
+    parser.add_argument('--initial-distance', type=float, default=DEFAULT_SCENARIO['initial_distance'], help='initial distance in meters')
+    parser.add_argument('--frames', type=int, default=600, help='simulation frames per candidate')
+    parser.add_argument('--fps', type=int, default=30, help='simulation frames per second')
+    parser.add_argument('--workers', type=int, default=None, help='number of worker processes')
+    parser.add_argument('--seed', type=int, default=0, help='random seed of the refinement rounds')
+    parser.add_argument('--output-dir', default='optimizer', help='directory of pareto.csv and best_gains.json')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    optimizer = GainOptimizer(target_gap=args.target_gap, jerk_weight=args.jerk_weight, frames=args.frames, fps=args.fps, initial_distance=args.initial_distance, workers=args.workers, seed=args.seed)
+    candidates, metrics, costs = optimizer.run(grid_points=args.grid_points, rounds=args.rounds, samples=args.samples)
+
+    write_results(args.output_dir, candidates, metrics, costs, args.target_gap)
+
+
+if __name__ == '__main__':
+    main()
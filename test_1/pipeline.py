@@ -0,0 +1,87 @@
+import collections
+from concurrent.futures import Future, ThreadPoolExecutor
+
+
+class FramePipeline(object):
+
+    """
+    Runs the per-frame post-processing (drawing, logging) on a worker thread, in frame order.
+
+    The main loop keeps the frame-critical work (tick, state, control) on its own thread and submits
+    the rest of the frame to the pipeline, so the drawing and the disk writes of frame N overlap the
+    control of frame N+1 and the next server tick. A single worker runs the submitted frames one
+    after the other, so stateful steps such as the jerk filter and the telemetry rows keep their order.
+    At most `max_pending` frames wait in the pipeline, submitting more blocks until the oldest is done,
+    which bounds memory and latency when the post-processing is slower than the simulation.
+
+    Attributes:
+        max_pending (int): Maximum number of submitted frames not yet processed.
+        enabled (bool): When False, every frame is processed synchronously on the caller's thread.
+
+    Methods:
+        submit: Queue the post-processing of a frame.
+        drain: Wait for all the submitted frames and raise their first error.
+        close: Drain the pipeline and stop the worker thread.
+
+    Example:
+        with Scene(world, camera_front) as sync_mode, FramePipeline(max_pending=2) as pipeline:
+            while True:
+                data = sync_mode.tick(timeout=2.0)
+                ego_vehicle.apply_control(compute_control(data))
+                pipeline.submit(draw_and_log, data)
+    """
+
+    def __init__(self, max_pending: int = 2, enabled: bool = True):
+        self.max_pending = max_pending
+        self.enabled = enabled
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='frame-pipeline') if enabled else None
+        self._pending = collections.deque()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args, **kwargs):
+        self.close()
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        """
+        Queue the post-processing of a frame.
+
+        Args:
+            fn (callable): Function processing the frame, called on the worker thread.
+            *args: Positional arguments of fn, they must not change after the call (e.g. snapshot states).
+            **kwargs: Keyword arguments of fn.
+
+        Returns:
+            Future: The future of fn, already done when the pipeline is disabled.
+
+        Raises:
+            Exception: The error of an earlier frame, raised as soon as it is known.
+        """
+        if not self.enabled:
+            future = Future()
+            future.set_result(fn(*args, **kwargs))
+            return future
+
+        # Backpressure, and surface the errors of the processed frames
+        while self._pending and (self._pending[0].done() or len(self._pending) >= self.max_pending):
+            self._pending.popleft().result()
+
+        future = self._executor.submit(fn, *args, **kwargs)
+        self._pending.append(future)
+        return future
+
+    def drain(self) -> None:
+        while self._pending:
+            self._pending.popleft().result()
+
+    def close(self) -> None:
+        if self._executor is None:
+            return
+        try:
+            self.drain()
+        finally:
+            # Wait for the worker even when a frame failed, so nothing writes after the caller moves on
+            self._executor.shutdown(wait=True)
+            self._executor = None
+            self._pending.clear()
@@ -0,0 +1,163 @@
+import numpy as np
+
+
+def build_projection_matrix(w: int, h: int, fov: float) -> np.ndarray:
+    """
+    Build a perspective projection matrix for a given image size and field of view.
+
+    Args:
+        w (int): Width of the image (in pixels).
+        h (int): Height of the image (in pixels).
+        fov (float): Horizontal field of view angle (in degrees).
+
+    Returns:
+        np.ndarray: Camera intrinsic matrix (3x3).
+
+    Example:
+        K = build_projection_matrix(1920, 1080, 90)
+        print(K)
+        # Output:
+        # array([[ 960.,    0.,  960.],
+        #        [   0.,  960.,  540.],
+        #        [   0.,    0.,    1.]])
+    """
+    focal = w / (2.0 * np.tan(fov * np.pi / 360.0))
+    K = np.identity(3)
+    K[0, 0] = K[1, 1] = focal
+    K[0, 2] = w / 2.0
+    K[1, 2] = h / 2.0
+    return K
+
+
+def locations_to_array(locations) -> np.ndarray:
+    """
+    Stack an iterable of carla.Location (or carla.Vector3D) into an (N, 3) array.
+
+    Args:
+        locations: Iterable of objects with x, y and z attributes.
+
+    Returns:
+        np.ndarray: Array of shape (N, 3) with the world coordinates.
+    """
+    return np.array([(loc.x, loc.y, loc.z) for loc in locations], dtype=np.float64).reshape(-1, 3)
+
+
+def project_points(points: np.ndarray, K: np.ndarray, w2c: np.ndarray, image_size: tuple[int, int] = None) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Project world-space points onto the image plane of a camera.
+
+    Args:
+        points (np.ndarray): World-space points of shape (N, 3).
+        K (np.ndarray): The camera intrinsic matrix (3x3).
+        w2c (np.ndarray): The world-to-camera transformation matrix (4x4).
+        image_size (tuple[int, int], optional): Image (width, height). When given, points outside the
+            image are also marked as not visible.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: The image-space coordinates of shape (N, 2) and a boolean
+        visibility mask of shape (N,), false for points behind the camera (or outside the image).
+        Points behind the camera are still projected (mirrored), as the single point version did.
+
+    The world-to-camera transform and the change from the UE4 axes (x forward, y right, z up) to the
+    standard camera axes (x right, y down, z forward) are folded into a single 3x4 matrix, so the whole
+    batch is projected with one matrix product.
+
+    Example:
+        points = np.array([[10.0, 0.0, 0.0], [-10.0, 0.0, 0.0]])
+        pixels, visible = project_points(points, K, np.identity(4))
+        print(pixels[visible])  # Output: [[960. 540.]]
+    """
+    axes = np.array([[0.0, 1.0, 0.0],
+                     [0.0, 0.0, -1.0],
+                     [1.0, 0.0, 0.0]])
+    P = K @ axes @ w2c[:3, :]
+
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+    points_img = points @ P[:, :3].T + P[:, 3]
+
+    depth = points_img[:, 2]
+    visible = depth > 1e-6
+
+    pixels = np.divide(points_img[:, :2], depth[:, None], out=np.zeros((len(points), 2)), where=depth[:, None] != 0)
+
+    if image_size is not None:
+        visible &= (pixels[:, 0] >= 0) & (pixels[:, 0] < image_size[0]) & (pixels[:, 1] >= 0) & (pixels[:, 1] < image_size[1])
+
+    return pixels, visible
+
+
+def transform_matrices(locations: np.ndarray, rotations: np.ndarray) -> np.ndarray:
+    """
+    Build the local-to-world matrices of a batch of carla.Transform.
+
+    Args:
+        locations (np.ndarray): Locations (x, y, z) in meters, shape (N, 3).
+        rotations (np.ndarray): Rotations (pitch, yaw, roll) in degrees, shape (N, 3).
+
+    Returns:
+        np.ndarray: Matrices of shape (N, 4, 4), equal to `carla.Transform.get_matrix()` of every transform.
+
+    Example:
+        matrices = transform_matrices(np.array([[1.0, 2.0, 0.0]]), np.array([[0.0, 90.0, 0.0]]))
+    """
+    locations = np.asarray(locations, dtype=np.float64).reshape(-1, 3)
+    pitch, yaw, roll = np.radians(np.asarray(rotations, dtype=np.float64).reshape(-1, 3)).T
+    cp, sp = np.cos(pitch), np.sin(pitch)
+    cy, sy = np.cos(yaw), np.sin(yaw)
+    cr, sr = np.cos(roll), np.sin(roll)
+
+    matrices = np.zeros((len(locations), 4, 4))
+    matrices[:, 0, :3] = np.stack((cp * cy, cy * sp * sr - sy * cr, -cy * sp * cr - sy * sr), axis=-1)
+    matrices[:, 1, :3] = np.stack((cp * sy, sy * sp * sr + cy * cr, -sy * sp * cr + cy * sr), axis=-1)
+    matrices[:, 2, :3] = np.stack((sp, -cp * sr, cp * cr), axis=-1)
+    matrices[:, :3, 3] = locations
+    matrices[:, 3, 3] = 1.0
+    return matrices
+
+
+# Corners of the unit box, the bounding box vertices are the center plus these signs times the extent
+BOX_CORNERS = np.array([(x, y, z) for x in (-1.0, 1.0) for y in (-1.0, 1.0) for z in (-1.0, 1.0)])
+
+
+def box_world_vertices(matrices: np.ndarray, centers: np.ndarray, extents: np.ndarray) -> np.ndarray:
+    """
+    World-space vertices of a batch of bounding boxes.
+
+    Args:
+        matrices (np.ndarray): Local-to-world matrices of the actors, shape (N, 4, 4).
+        centers (np.ndarray): Bounding box locations relative to the actors, shape (N, 3).
+        extents (np.ndarray): Bounding box half sizes, shape (N, 3).
+
+    Returns:
+        np.ndarray: Vertices of shape (N, 8, 3), like `carla.BoundingBox.get_world_vertices` for boxes
+        without rotation relative to their actor (the case of vehicle bounding boxes).
+    """
+    local = centers[:, None, :] + BOX_CORNERS[None, :, :] * extents[:, None, :]
+    return np.einsum('nij,nkj->nki', matrices[:, :3, :3], local) + matrices[:, None, :3, 3]
+
+
+def spheres_in_frustum(centers: np.ndarray, radii: np.ndarray, K: np.ndarray, w2c: np.ndarray, far: float = np.inf) -> np.ndarray:
+    """
+    Conservative visibility test of bounding spheres against the camera frustum.
+
+    Args:
+        centers (np.ndarray): World-space sphere centers, shape (N, 3).
+        radii (np.ndarray): Sphere radii in meters, shape (N,).
+        K (np.ndarray): The camera intrinsic matrix (3x3), its principal point is the image center.
+        w2c (np.ndarray): The world-to-camera transformation matrix (4x4).
+        far (float): Far plane distance in meters.
+
+    Returns:
+        np.ndarray: Boolean mask of shape (N,), false for the spheres entirely outside the frustum.
+        A sphere that is only partially visible is kept.
+    """
+    # Camera axes of w2c are UE4 axes: x forward, y right, z up
+    camera = np.asarray(centers, dtype=np.float64).reshape(-1, 3) @ w2c[:3, :3].T + w2c[:3, 3]
+    depth, right, up = camera.T
+
+    visible = (depth + radii > 0.0) & (depth - radii < far)
+    for offset, tan_half_fov in ((right, K[0, 2] / K[0, 0]), (up, K[1, 2] / K[1, 1])):
+        # Signed distance to the two side planes through the camera center
+        cos, sin = 1.0 / np.hypot(1.0, tan_half_fov), tan_half_fov / np.hypot(1.0, tan_half_fov)
+        visible &= (np.abs(offset) * cos - depth * sin <= radii)
+    return visible
@@ -0,0 +1,174 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import carla
+import cv2
+import numpy as np
+
+RECORD_FORMATS = ('png', 'jpeg', 'raw')
+INDEX_FIELDS = ('frame', 'sensor', 'timestamp', 'file', 'offset', 'width', 'height')
+
+
+class FrameRecorder(object):
+
+    """
+    Records camera frames to disk on a background writer pool.
+
+    The main loop thread only indexes the image and hands it to the pool, the wrapping of the raw BGRA
+    buffer, the encoding and the disk writes run on worker threads (OpenCV releases the GIL while
+    encoding). The pending task holds the carla.Image itself, the view of `raw_data` does not keep the
+    image alive on its own. At most `max_pending` frames wait for the writers: when the disk falls
+    behind, `record` blocks until a slot is free, which slows the loop down instead of growing the
+    memory. Every frame gets a line in `index.csv`, in INDEX_FIELDS order, with the file holding it
+    and its byte offset.
+
+    Formats:
+        - 'png': one lossless PNG per frame, with a fast compression level by default.
+        - 'jpeg': one JPEG per frame.
+        - 'raw': the BGRA buffers appended to chunk files of `chunk_frames` frames, by a single writer so
+          the offsets of the index stay valid. This is the cheapest format to record.
+
+    Attributes:
+        output_dir (str): Directory of the frames and of the index file.
+        fmt (str): Record format, one of RECORD_FORMATS.
+        max_pending (int): Maximum number of frames waiting to be written.
+        recorded (int): Number of frames recorded.
+        stall_time (float): Total time in seconds `record` waited for a free slot.
+
+    Methods:
+        open: Create the output directory and the index file.
+        record: Queue a camera image for writing.
+        close: Wait for the pending writes and close the files.
+
+    Example:
+        with FrameRecorder('frames', fmt='jpeg') as recorder:
+            recorder.record(image)
+    """
+
+    def __init__(self, output_dir: str, fmt: str = 'png', workers: int = 4, max_pending: int = 16, chunk_frames: int = 100, png_compression: int = 1, jpeg_quality: int = 90):
+        if fmt not in RECORD_FORMATS:
+            raise ValueError(f'unknown record format {fmt!r}, expected one of {RECORD_FORMATS}')
+        self.output_dir = output_dir
+        self.fmt = fmt
+        self.workers = 1 if fmt == 'raw' else workers
+        self.max_pending = max_pending
+        self.chunk_frames = chunk_frames
+        self.recorded = 0
+        self.stall_time = 0.0
+        self._params = {
+            'png': [cv2.IMWRITE_PNG_COMPRESSION, png_compression],
+            'jpeg': [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality],
+        }.get(fmt, [])
+        self._executor = None
+        self._slots = None
+        self._index = None
+        self._chunk = None
+        self._chunk_offset = 0
+        self._error = None
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, *args, **kwargs):
+        self.close()
+
+    def open(self) -> None:
+        if self._executor is not None:
+            return
+        os.makedirs(self.output_dir, exist_ok=True)
+        self._index = open(os.path.join(self.output_dir, 'index.csv'), 'w')
+        self._index.write(','.join(INDEX_FIELDS) + '\n')
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='frame-recorder')
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+
+    def record(self, image: carla.Image, sensor: int = 0) -> None:
+        """
+        Queue a camera image for writing.
+
+        Args:
+            image (carla.Image): BGRA camera image.
+            sensor (int): Index of the sensor, used in the file names and the index.
+
+        Raises:
+            Exception: The error of an earlier write.
+        """
+        if self._executor is None:
+            self.open()
+        if self._error is not None:
+            raise self._error
+
+        # Backpressure, wait for a writer when too many frames are pending
+        if not self._slots.acquire(blocking=False):
+            start = time.monotonic()
+            self._slots.acquire()
+            self.stall_time += time.monotonic() - start
+
+        if self.fmt == 'raw':
+            filename = f'frames_{self.recorded // self.chunk_frames:05d}.raw'
+            offset = 0 if self.recorded % self.chunk_frames == 0 else self._chunk_offset
+            self._chunk_offset = offset + image.width * image.height * 4
+        else:
+            filename = f'sensor{sensor}_{image.frame:08d}.{"jpg" if self.fmt == "jpeg" else "png"}'
+            offset = 0
+
+        self._index.write(f'{image.frame},{sensor},{image.timestamp},{filename},{offset},{image.width},{image.height}\n')
+        self.recorded += 1
+
+        future = self._executor.submit(self._write, image, os.path.join(self.output_dir, filename), offset)
+        future.add_done_callback(self._done)
+
+    def _write(self, image: carla.Image, path: str, offset: int) -> None:
+        # raw_data does not own its memory, the image must stay referenced while the view is in use
+        frame = np.frombuffer(image.raw_data, dtype=np.uint8).reshape((image.height, image.width, 4))
+        if self.fmt == 'raw':
+            # Single writer thread, the chunks are written sequentially
+            if offset == 0:
+                if self._chunk is not None:
+                    self._chunk.close()
+                self._chunk = open(path, 'wb')
+            self._chunk.write(frame.data)
+            return
+
+        ok, encoded = cv2.imencode(os.path.splitext(path)[1], frame[:, :, :3], self._params)
+        if not ok:
+            raise RuntimeError(f'failed to encode {path}')
+        with open(path, 'wb') as f:
+            f.write(encoded.data)
+
+    def _done(self, future) -> None:
+        self._slots.release()
+        if future.exception() is not None and self._error is None:
+            self._error = future.exception()
+
+    def close(self) -> None:
+        if self._executor is None:
+            return
+        self._executor.shutdown(wait=True)
+        self._executor = None
+        if self._chunk is not None:
+            self._chunk.close()
+            self._chunk = None
+        self._index.close()
+        self._index = None
+        if self._error is not None:
+            raise self._error
+
+
+def read_raw_frame(output_dir: str, row: dict) -> np.ndarray:
+    """
+    Read one frame of a 'raw' recording.
+
+    Args:
+        output_dir (str): Directory of the recording.
+        row (dict): Line of index.csv, e.g. from csv.DictReader.
+
+    Returns:
+        np.ndarray: The BGRA frame of shape (height, width, 4).
+    """
+    width, height = int(row['width']), int(row['height'])
+    with open(os.path.join(output_dir, row['file']), 'rb') as f:
+        f.seek(int(row['offset']))
+        return np.frombuffer(f.read(width * height * 4), dtype=np.uint8).reshape((height, width, 4))
@@ -0,0 +1,48 @@
+import carla
+
+# The CCRs scenario, initial_distance is the spawn distance between the two vehicles' centers
+DEFAULT_SCENARIO = {
+    'town': '/Game/Carla/Maps/Town02',
+    'initial_distance': 105.0,
+    'target_speed': None,
+    'ego_blueprint': 'vehicle.bmw.grandtourer',
+    'target_blueprint': 'vehicle.tesla.model3',
+    'desired_range': 1.0,
+    'kt_p': 0.56,
+    'kt_d': 0.015,
+    'kb_p': 0.75,
+}
+
+
+def resolve_scenario(**overrides) -> dict:
+    """
+    Merge scenario overrides into DEFAULT_SCENARIO.
+
+    Args:
+        **overrides: Scenario parameters to change, every key must exist in DEFAULT_SCENARIO.
+
+    Returns:
+        dict: The complete scenario.
+
+    Raises:
+        ValueError: If an override is not a scenario parameter.
+    """
+    unknown = set(overrides) - set(DEFAULT_SCENARIO)
+    if unknown:
+        raise ValueError(f'unknown scenario parameters: {sorted(unknown)}')
+    return {**DEFAULT_SCENARIO, **overrides}
+
+
+def get_start_poses(initial_distance: float) -> tuple[carla.Transform, carla.Transform]:
+    """
+    Get the start poses of the stationary and the ego vehicles in Town02.
+
+    Args:
+        initial_distance (float): Distance between the two vehicles' centers in meters.
+
+    Returns:
+        tuple[carla.Transform, carla.Transform]: The stationary vehicle pose and the ego vehicle pose.
+    """
+    stationary_start_pose = carla.Transform(carla.Location(x=-7.53, y=170.0, z=0.3), carla.Rotation(pitch=0.0, yaw=-90.0, roll=0.0))
+    ego_start_pose = carla.Transform(carla.Location(x=-7.53, y=170.0 + initial_distance, z=0.3), carla.Rotation(pitch=0.0, yaw=-90.0, roll=0.0))
+    return stationary_start_pose, ego_start_pose
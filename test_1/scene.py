@@ -6,9 +6,13 @@
 # This work is licensed under the terms of the MIT license.
 # For a copy, see <https://opensource.org/licenses/MIT>.
 
+import collections
 import glob
+import logging
 import os
 import sys
+import threading
+import time
 
 try:
     sys.path.append(glob.glob('../carla/dist/carla-*%d.%d-%s.egg' % (
@@ -31,6 +35,87 @@ try:
 except ImportError:
     import Queue as queue
 
+from telemetry_schema import TELEMETRY_FIELDS
+
+TIMEOUT_POLICIES = ('abort', 'skip', 'reuse')
+
+
+class SensorQueue(object):
+
+    """
+    Bounded, frame-indexed buffer of the data received from one sensor.
+
+    The sensor callback stores each measurement under its frame number. When the buffer is full the
+    oldest measurement is dropped, so a consumer that falls behind never makes the buffer grow.
+    The consumer asks for a given frame and waits for it, the older measurements are discarded.
+
+    Attributes:
+        maxsize (int): Maximum number of buffered measurements.
+        dropped (int): Measurements dropped because the buffer was full.
+        stale (int): Measurements discarded because a later frame was requested.
+        late (int): Requested frames that did not arrive before the timeout.
+        last (object): Last measurement returned by get, None before the first one.
+
+    Methods:
+        put: Store a measurement, used as the sensor callback.
+        get: Wait for the measurement of a given frame.
+
+    Example:
+        sensor_queue = SensorQueue(maxsize=4)
+        camera.listen(sensor_queue.put)
+        image = sensor_queue.get(frame, timeout=2.0)
+    """
+
+    def __init__(self, maxsize: int = 4):
+        self.maxsize = maxsize
+        self.dropped = 0
+        self.stale = 0
+        self.late = 0
+        self.last = None
+        self._data = collections.OrderedDict()
+        self._condition = threading.Condition()
+
+    def put(self, data) -> None:
+        with self._condition:
+            self._data[data.frame] = data
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.dropped += 1
+            self._condition.notify_all()
+
+    def get(self, frame: int, timeout: float):
+        """
+        Wait for the measurement of a given frame.
+
+        Args:
+            frame (int): Simulation frame of the requested measurement.
+            timeout (float): Maximum time to wait in seconds.
+
+        Returns:
+            The measurement of the requested frame.
+
+        Raises:
+            queue.Empty: The measurement did not arrive before the timeout.
+        """
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while True:
+                # Discard everything older than the requested frame
+                while self._data and next(iter(self._data)) < frame:
+                    self._data.popitem(last=False)
+                    self.stale += 1
+
+                data = self._data.pop(frame, None)
+                if data is not None:
+                    self.last = data
+                    return data
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.late += 1
+                    raise queue.Empty(f'frame {frame} not received within {timeout} s')
+                self._condition.wait(remaining)
+
 
 class Scene(object):
 
@@ -45,7 +130,14 @@ class Scene(object):
         sensors (tuple): A tuple containing sensor objects used in the scene.
         frame: The current frame of the simulation.
         delta_seconds (float): Time interval between simulation frames.
-        _queues (list): A list of queues for handling event data from sensors.
+        telemetry (TelemetryWriter): Optional telemetry writer, opened on entry and closed on exit.
+        recorder (FrameRecorder): Optional recorder of the camera images, opened on entry and closed on exit.
+        queue_size (int): Maximum number of measurements buffered per sensor, the oldest are dropped.
+        timeout_policies (list): Policy of every sensor when its frame does not arrive in time: 'abort'
+            raises queue.Empty, 'skip' returns None for that sensor and 'reuse' returns its last measurement
+            (None if there is none yet).
+        sensor_timeouts (list): Timeout of every sensor in seconds, None to use the timeout passed to tick.
+        _queues (list): A list of SensorQueue for handling event data from the world and the sensors.
         _settings: Carla world settings used to restore the original settings when exiting the scene.
 
     Methods:
@@ -54,18 +146,27 @@ class Scene(object):
         tick: Advances the simulation by one frame and retrieves sensor data.
         __exit__: Context manager exit method to clean up the scene.
         _retrieve_data: Retrieves sensor data from the queue.
+        get_queue_stats: Counters of dropped, stale and late frames of every sensor.
         spawn_vehicle: Spawns a vehicle in the simulation.
         remove_all_actors: Removes all actors from the simulation.
         should_quit: Checks if the user wants to quit the simulation.
-        save_data_to_csv: Saves vehicle data to a CSV file.
+        save_data_to_csv: Saves vehicle data to a CSV file (reopens the file on every call, prefer TelemetryWriter).
         get_vehicle_dimensions: Retrieves the dimensions of a vehicle.
+        get_camera_blueprint: Builds the RGB camera blueprint.
+        get_camera_transform: Computes the camera pose relative to the ego vehicle.
         spawn_camera: Spawns a camera sensor attached to a vehicle.
+        get_radar_transform: Computes the radar pose relative to the ego vehicle.
+        spawn_radar: Spawns a forward radar attached to a vehicle.
 
     Example:
         with Scene(world, sensor_front, sensor_rear) as scene:
             while not scene.should_quit():
                 data = scene.tick(timeout=1)
                 process_data(data)
+
+        # A slow rear camera must not stop the run, reuse its last image instead
+        with Scene(world, sensor_front, sensor_rear, timeout_policy=['abort', 'reuse'], sensor_timeouts=[None, 0.1]) as scene:
+            data = scene.tick(timeout=1)
     """
 
     def __init__(self, world, *sensors, **kwargs):
@@ -73,18 +174,39 @@ class Scene(object):
         self.sensors = sensors
         self.frame = None
         self.delta_seconds = 1.0 / kwargs.get('fps', 20)
+        self.no_rendering_mode = kwargs.get('no_rendering_mode', False)
+        self.telemetry = kwargs.get('telemetry', None)
+        self.recorder = kwargs.get('recorder', None)
+        self.queue_size = kwargs.get('queue_size', 4)
+        self.timeout_policies = self._per_sensor(kwargs.get('timeout_policy', 'abort'), len(sensors))
+        self.sensor_timeouts = self._per_sensor(kwargs.get('sensor_timeouts', None), len(sensors))
+        for policy in self.timeout_policies:
+            if policy not in TIMEOUT_POLICIES:
+                raise ValueError(f'unknown timeout policy {policy!r}, expected one of {TIMEOUT_POLICIES}')
         self._queues = []
         self._settings = None
 
+    @staticmethod
+    def _per_sensor(value, count):
+        if isinstance(value, (list, tuple)):
+            if len(value) != count:
+                raise ValueError(f'expected one value per sensor ({count}), got {len(value)}')
+            return list(value)
+        return [value] * count
+
     def __enter__(self):
+        if self.telemetry is not None:
+            self.telemetry.open()
+        if self.recorder is not None:
+            self.recorder.open()
         self._settings = self.world.get_settings()
         self.frame = self.world.apply_settings(carla.WorldSettings(
-            no_rendering_mode=False,
+            no_rendering_mode=self.no_rendering_mode,
             synchronous_mode=True,
             fixed_delta_seconds=self.delta_seconds))
 
         def make_queue(register_event):
-            q = queue.Queue()
+            q = SensorQueue(self.queue_size)
             register_event(q.put)
             self._queues.append(q)
 
@@ -95,18 +217,48 @@ class Scene(object):
 
     def tick(self, timeout):
         self.frame = self.world.tick()
-        data = [self._retrieve_data(q, timeout) for q in self._queues]
-        assert all(x.frame == self.frame for x in data)
+        # The world snapshot always aborts, a missing snapshot means the server is gone
+        data = [self._retrieve_data(self._queues[0], timeout)]
+        for sensor_queue, policy, sensor_timeout in zip(self._queues[1:], self.timeout_policies, self.sensor_timeouts):
+            data.append(self._retrieve_data(sensor_queue, timeout if sensor_timeout is None else sensor_timeout, policy))
+
+        if self.recorder is not None:
+            # Only the camera images of this frame, a reused image was already recorded
+            for index, measurement in enumerate(data[1:]):
+                if isinstance(measurement, carla.Image) and measurement.frame == self.frame:
+                    self.recorder.record(measurement, sensor=index)
         return data
 
     def __exit__(self, *args, **kwargs):
         self.world.apply_settings(self._settings)
+        if self.telemetry is not None:
+            self.telemetry.close()
+        if self.recorder is not None:
+            self.recorder.close()
+            if self.recorder.stall_time > 0:
+                logging.warning(f'frame recorder: the disk stalled the loop for {self.recorder.stall_time:.2f} s')
+        for index, stats in enumerate(self.get_queue_stats()[1:]):
+            if stats['dropped'] or stats['late']:
+                logging.warning(f'sensor {index}: {stats["dropped"]} dropped, {stats["stale"]} stale and {stats["late"]} late frames')
 
-    def _retrieve_data(self, sensor_queue, timeout):
-        while True:
-            data = sensor_queue.get(timeout=timeout)
-            if data.frame == self.frame:
-                return data
+    def _retrieve_data(self, sensor_queue, timeout, policy='abort'):
+        try:
+            return sensor_queue.get(self.frame, timeout)
+        except queue.Empty:
+            if policy == 'abort':
+                raise
+            if policy == 'reuse':
+                return sensor_queue.last
+            return None
+
+    def get_queue_stats(self) -> list[dict]:
+        """
+        Counters of the world snapshot queue followed by every sensor queue.
+
+        Returns:
+            list[dict]: One dictionary per queue with the dropped, stale and late frame counts.
+        """
+        return [{'dropped': q.dropped, 'stale': q.stale, 'late': q.late} for q in self._queues]
     
     @staticmethod
     def spawn_vehicle(world, blueprint_name, transform):
@@ -131,7 +283,7 @@ class Scene(object):
     
     @staticmethod
     def save_data_to_csv(velocity: carla.Vector3D, acceleration: carla.Vector3D, jerk: list[float], relative_distance: float, bbox: list[float], filename: str) -> None:
-        header = "velocity_x,velocity_y,velocity_z,acceleration_x,acceleration_y,acceleration_z,jerk_x,jerk_y,jerk_z,relative_distance,bbox_top_left_x,bbox_top_left_y,bbox_top_right_x,bbox_top_right_y,bbox_bottom_left_x,bbox_bottom_left_y,bbox_bottom_right_x,bbox_bottom_right_y\n"
+        header = ','.join(TELEMETRY_FIELDS) + '\n'
         if not os.path.exists(filename) or os.path.getsize(filename) == 0:
             with open(filename, 'w') as f:
                 f.write(header)
@@ -150,17 +302,43 @@ class Scene(object):
         return dimensions
     
     @staticmethod
-    def spawn_camera(world: carla.World, ego_vehicle: carla.Vehicle, ego_vehicle_dimensions: list[float], view_width: int=1920, view_height: int=1080, view_fov: int=90) -> tuple[carla.Actor, carla.Sensor]:
-        sensor_front = world.get_blueprint_library().find('sensor.camera.rgb')
-        sensor_front.set_attribute('image_size_x', str(view_width))
-        sensor_front.set_attribute('image_size_y', str(view_height))
-        sensor_front.set_attribute('fov', str(view_fov))
+    def get_camera_blueprint(world: carla.World, view_width: int=1920, view_height: int=1080, view_fov: int=90) -> carla.ActorBlueprint:
+        camera_bp = world.get_blueprint_library().find('sensor.camera.rgb')
+        camera_bp.set_attribute('image_size_x', str(view_width))
+        camera_bp.set_attribute('image_size_y', str(view_height))
+        camera_bp.set_attribute('fov', str(view_fov))
+        return camera_bp
 
+    @staticmethod
+    def get_camera_transform(ego_vehicle_dimensions: list[float]) -> carla.Transform:
         camera_offsets = [x/2 for x in ego_vehicle_dimensions]
-        
+        return carla.Transform(carla.Location(x=camera_offsets[0], y=camera_offsets[1], z=camera_offsets[2]), carla.Rotation(pitch=0, yaw=0, roll=0))
+
+    @staticmethod
+    def spawn_camera(world: carla.World, ego_vehicle: carla.Vehicle, ego_vehicle_dimensions: list[float], view_width: int=1920, view_height: int=1080, view_fov: int=90) -> tuple[carla.Actor, carla.Sensor]:
+        sensor_front = Scene.get_camera_blueprint(world, view_width, view_height, view_fov)
+
         camera_front = world.spawn_actor(
             sensor_front,
-            carla.Transform(carla.Location(x=camera_offsets[0], y=camera_offsets[1], z=camera_offsets[2]), carla.Rotation(pitch=0, yaw=0, roll=0)),
+            Scene.get_camera_transform(ego_vehicle_dimensions),
             attach_to=ego_vehicle)
         
-        return camera_front, sensor_front
\ No newline at end of file
+        return camera_front, sensor_front
+
+    @staticmethod
+    def get_radar_transform(ego_vehicle_dimensions: list[float]) -> carla.Transform:
+        # Just ahead of the front bumper, at mid height, so the radar does not see the ego vehicle
+        return carla.Transform(carla.Location(x=ego_vehicle_dimensions[0] / 2 + 0.05, z=ego_vehicle_dimensions[2] / 2), carla.Rotation(pitch=0, yaw=0, roll=0))
+
+    @staticmethod
+    def spawn_radar(world: carla.World, ego_vehicle: carla.Vehicle, ego_vehicle_dimensions: list[float], radar_range: float=100.0, horizontal_fov: float=30.0, vertical_fov: float=10.0, points_per_second: int=1500) -> carla.Sensor:
+        radar_bp = world.get_blueprint_library().find('sensor.other.radar')
+        radar_bp.set_attribute('range', str(radar_range))
+        radar_bp.set_attribute('horizontal_fov', str(horizontal_fov))
+        radar_bp.set_attribute('vertical_fov', str(vertical_fov))
+        radar_bp.set_attribute('points_per_second', str(points_per_second))
+
+        return world.spawn_actor(
+            radar_bp,
+            Scene.get_radar_transform(ego_vehicle_dimensions),
+            attach_to=ego_vehicle)
@@ -0,0 +1,343 @@
+import argparse
+import itertools
+import logging
+import math
+
+import carla
+import numpy as np
+
+from analysis import BatchMetrics
+from controller import Controller
+from dynamics import BatchDynamics, Dynamics
+from scenario import get_start_poses, resolve_scenario
+from telemetry import make_telemetry_writer
+
+GRAVITY = 9.81  # m/s^2
+
+# Half length, half width and half height in meters of the blueprints used by the scenarios,
+# taken from their CARLA bounding boxes
+VEHICLE_EXTENTS = {
+    'vehicle.bmw.grandtourer': (2.306, 1.120, 0.832),
+    'vehicle.tesla.model3': (2.396, 1.082, 0.748),
+}
+DEFAULT_EXTENT = (2.35, 1.0, 0.8)
+
+# Pedal position to acceleration maps, linearly interpolated, fitted on a CARLA run of the CCRs scenario
+THROTTLE_MAP = ((0.0, 0.25, 0.5, 0.75, 1.0), (0.0, 1.2, 2.4, 3.4, 4.2))  # m/s^2 at standstill
+BRAKE_MAP = ((0.0, 0.25, 0.5, 0.75, 1.0), (0.0, 2.6, 5.2, 7.0, 8.5))  # m/s^2
+MAX_SPEED = 55.0  # m/s, the drive acceleration fades linearly to zero at this speed
+
+
+
+def longitudinal_step(speed, acceleration, throttle, brake, dt, rolling_resistance=0.015, drag=0.0004, actuator_time_constant=0.2):
+    """
+    Integrate the longitudinal dynamics over one time step (semi-implicit Euler), for scalars or arrays.
+
+    Args:
+        speed: Current speed in m/s.
+        acceleration: Current acceleration in m/s^2.
+        throttle: Throttle command in [0, 1].
+        brake: Brake command in [0, 1].
+        dt (float): Time step in seconds.
+        rolling_resistance (float): Rolling resistance coefficient.
+        drag (float): Aerodynamic drag per unit mass in 1/m.
+        actuator_time_constant (float): Time constant of the first-order actuator lag in seconds.
+
+    Returns:
+        tuple: The new speed, the new acceleration and the distance traveled during the step.
+    """
+    drive = np.interp(throttle, *THROTTLE_MAP) * np.maximum(1.0 - speed / MAX_SPEED, 0.0)
+    brake = np.interp(brake, *BRAKE_MAP)
+    resistance = rolling_resistance * GRAVITY + drag * speed ** 2
+
+    # Braking and resistance only hold a stopped vehicle, they never push it backwards
+    stopped = speed <= 0.0
+    commanded = drive - np.where(stopped, 0.0, brake + resistance)
+
+    acceleration = acceleration + (commanded - acceleration) * min(dt / actuator_time_constant, 1.0)
+    new_speed = speed + acceleration * dt
+
+    # Stop within the step instead of reversing
+    reversing = new_speed < 0.0
+    acceleration = np.where(reversing, -speed / dt, acceleration)
+    new_speed = np.maximum(new_speed, 0.0)
+
+    return new_speed, acceleration, 0.5 * (speed + new_speed) * dt
+
+class SimulatedVehicle(object):
+
+    """
+    Longitudinal point-mass vehicle that mimics the carla.Vehicle methods used by the scenario.
+
+    The vehicle moves along the forward vector of its spawn pose. The commanded acceleration comes from
+    the throttle and brake maps, minus rolling and aerodynamic resistance, and reaches the vehicle through
+    a first-order actuator lag, so the acceleration (and the jerk computed from it) stays continuous.
+
+    Attributes:
+        id (int): Actor id.
+        type_id (str): Blueprint name.
+        bounding_box (carla.BoundingBox): Bounding box of the vehicle, relative to its location.
+        speed (float): Current longitudinal speed in m/s.
+        acceleration (float): Current longitudinal acceleration in m/s^2.
+        distance (float): Distance traveled from the spawn location in meters.
+
+    Methods:
+        get_transform: Get the current transform of the vehicle.
+        get_location: Get the current location of the vehicle.
+        get_velocity: Get the current velocity vector of the vehicle.
+        get_acceleration: Get the current acceleration vector of the vehicle.
+        apply_control: Store the control applied on the next tick.
+        step: Integrate the longitudinal dynamics over one time step.
+
+    Example:
+        vehicle = SimulatedVehicle(1, 'vehicle.bmw.grandtourer', transform)
+        vehicle.apply_control(carla.VehicleControl(throttle=1.0))
+        vehicle.step(0.05)
+        print(vehicle.get_velocity())
+    """
+
+    def __init__(self, actor_id: int, type_id: str, transform: carla.Transform, rolling_resistance: float = 0.015, drag: float = 0.0004, actuator_time_constant: float = 0.2):
+        self.id = actor_id
+        self.type_id = type_id
+        self.bounding_box = carla.BoundingBox(carla.Location(), carla.Vector3D(*VEHICLE_EXTENTS.get(type_id, DEFAULT_EXTENT)))
+        self.rolling_resistance = rolling_resistance
+        self.drag = drag
+        self.actuator_time_constant = actuator_time_constant
+        self.simulate_physics = True
+
+        self.speed = 0.0
+        self.acceleration = 0.0
+        self.distance = 0.0
+        self._control = carla.VehicleControl()
+
+        self._start = transform
+        self._forward = transform.get_forward_vector()
+
+    def set_simulate_physics(self, enabled: bool) -> None:
+        self.simulate_physics = enabled
+
+    def get_location(self) -> carla.Location:
+        start = self._start.location
+        return carla.Location(x=start.x + self._forward.x * self.distance, y=start.y + self._forward.y * self.distance, z=start.z + self._forward.z * self.distance)
+
+    def get_transform(self) -> carla.Transform:
+        return carla.Transform(self.get_location(), self._start.rotation)
+
+    def get_velocity(self) -> carla.Vector3D:
+        return self._forward * self.speed
+
+    def get_acceleration(self) -> carla.Vector3D:
+        return self._forward * self.acceleration
+
+    def apply_control(self, control: carla.VehicleControl) -> None:
+        self._control = control
+
+    def destroy(self) -> bool:
+        return True
+
+    def step(self, dt: float) -> None:
+        """
+        Integrate the longitudinal dynamics over one time step, see longitudinal_step.
+
+        Args:
+            dt (float): Time step in seconds.
+        """
+        if not self.simulate_physics:
+            return
+
+        speed, acceleration, traveled = longitudinal_step(self.speed, self.acceleration, self._control.throttle, self._control.brake, dt, self.rolling_resistance, self.drag, self.actuator_time_constant)
+        self.speed = float(speed)
+        self.acceleration = float(acceleration)
+        self.distance += float(traveled)
+
+class SimulatedWorld(object):
+
+    """
+    Fixed-step world holding SimulatedVehicle actors, a drop-in for the carla.World calls of the scenario loop.
+
+    Attributes:
+        delta_seconds (float): Simulation time step in seconds.
+        frame (int): Current simulation frame.
+
+    Example:
+        world = SimulatedWorld(fps=30)
+        ego_vehicle = world.spawn_vehicle('vehicle.bmw.grandtourer', transform)
+        frame = world.tick()
+    """
+
+    def __init__(self, fps: int = 30):
+        self.delta_seconds = 1.0 / fps
+        self.frame = 0
+        self._actors = []
+        self._ids = itertools.count(1)
+
+    def spawn_vehicle(self, blueprint_name: str, transform: carla.Transform) -> SimulatedVehicle:
+        vehicle = SimulatedVehicle(next(self._ids), blueprint_name, transform)
+        self._actors.append(vehicle)
+        return vehicle
+
+    def get_actors(self) -> list[SimulatedVehicle]:
+        return list(self._actors)
+
+    def tick(self) -> int:
+        for actor in self._actors:
+            actor.step(self.delta_seconds)
+        self.frame += 1
+        return self.frame
+
+
+def run_simulated_scenario(telemetry_filename: str = None, frames: int = 600, fps: int = 30, **scenario) -> int:
+    """
+    Run the CCRs scenario on the NumPy vehicle model, with the same Dynamics, Controller and telemetry code as main.py.
+
+    Args:
+        telemetry_filename (str, optional): Telemetry output file, `.npz` selects the columnar binary format. Defaults to None (no telemetry).
+        frames (int): Number of simulation frames.
+        fps (int): Simulation frames per second.
+        **scenario: Overrides of DEFAULT_SCENARIO, the town is ignored.
+
+    Returns:
+        int: Number of simulated frames.
+
+    The bounding box columns are logged as zeros, the simulator has no camera.
+    """
+    scenario = resolve_scenario(**scenario)
+    world = SimulatedWorld(fps=fps)
+
+    stationary_start_pose, ego_start_pose = get_start_poses(scenario['initial_distance'])
+    stationary_vehicle = world.spawn_vehicle(scenario['target_blueprint'], stationary_start_pose)
+    ego_vehicle = world.spawn_vehicle(scenario['ego_blueprint'], ego_start_pose)
+    stationary_vehicle.set_simulate_physics(False)
+
+    ego_vehicle_dimensions = [2 * extent for extent in (ego_vehicle.bounding_box.extent.x, ego_vehicle.bounding_box.extent.y, ego_vehicle.bounding_box.extent.z)]
+    stationary_vehicle_dimensions = [2 * extent for extent in (stationary_vehicle.bounding_box.extent.x, stationary_vehicle.bounding_box.extent.y, stationary_vehicle.bounding_box.extent.z)]
+
+    state = Dynamics(ego_vehicle, dt=(1/20))
+    telemetry = make_telemetry_writer(telemetry_filename, flush_rows=1000, flush_interval=5.0) if telemetry_filename else None
+    no_bbox = [0, 0, 0, 0]
+
+    try:
+        for _ in range(frames):
+            world.tick()
+
+            relative_distance = state.get_ground_truth_relative_distance(ego_vehicle, stationary_vehicle, ego_vehicle_dimensions, stationary_vehicle_dimensions)
+            velocity = state.get_velocity(ego_vehicle)
+            speed = math.sqrt(velocity.x ** 2 + velocity.y ** 2 + velocity.z ** 2)
+            control = Controller.range_controller(relative_distance, speed, desired_range=scenario['desired_range'], kt_p=scenario['kt_p'], kt_d=scenario['kt_d'], kb_p=scenario['kb_p'], target_speed=scenario['target_speed'])
+            ego_vehicle.apply_control(control)
+
+            if telemetry is not None:
+                telemetry.write(velocity, state.get_acceleration(ego_vehicle), state.get_jerk(ego_vehicle), relative_distance, no_bbox)
+    finally:
+        if telemetry is not None:
+            telemetry.close()
+
+    return world.frame
+
+
+
+class BatchSimulator(object):
+
+    """
+    N independent longitudinal vehicles stepped in lockstep with array operations.
+
+    Attributes:
+        delta_seconds (float): Simulation time step in seconds.
+        speed (np.ndarray): Speeds in m/s, shape (N,).
+        acceleration (np.ndarray): Accelerations in m/s^2, shape (N,).
+        distance (np.ndarray): Distances traveled from the spawn locations in meters, shape (N,).
+
+    Example:
+        plant = BatchSimulator(1000, fps=30)
+        plant.step(throttle, brake)
+    """
+
+    def __init__(self, n: int, fps: int = 30, rolling_resistance: float = 0.015, drag: float = 0.0004, actuator_time_constant: float = 0.2):
+        self.delta_seconds = 1.0 / fps
+        self.rolling_resistance = rolling_resistance
+        self.drag = drag
+        self.actuator_time_constant = actuator_time_constant
+        self.speed = np.zeros(n)
+        self.acceleration = np.zeros(n)
+        self.distance = np.zeros(n)
+
+    def step(self, throttle: np.ndarray, brake: np.ndarray) -> None:
+        self.speed, self.acceleration, traveled = longitudinal_step(self.speed, self.acceleration, throttle, brake, self.delta_seconds, self.rolling_resistance, self.drag, self.actuator_time_constant)
+        self.distance += traveled
+
+
+BATCH_PARAMETERS = ('initial_distance', 'target_speed', 'desired_range', 'kt_p', 'kt_d', 'kb_p')
+
+
+def run_batch_scenarios(frames: int = 600, fps: int = 30, max_jerk: float = 10.0, **scenario) -> dict[str, np.ndarray]:
+    """
+    Run N CCRs scenarios in lockstep on the batched vehicle model and compute their metrics.
+
+    Args:
+        frames (int): Number of simulation frames.
+        fps (int): Simulation frames per second.
+        max_jerk (float): Saturation of the jerk, 10 m/s^3 like Dynamics.get_jerk, np.inf to measure the raw peak.
+        **scenario: Overrides of DEFAULT_SCENARIO. initial_distance, target_speed (NaN for full throttle),
+            desired_range, kt_p, kt_d and kb_p accept arrays, broadcast together to N scenarios.
+            The blueprints are shared by all the scenarios.
+
+    Returns:
+        dict[str, np.ndarray]: The broadcast parameters and the analysis metrics (see analysis.BatchMetrics), shape (N,) each.
+
+    Every step follows the order of the main loop: tick the plant, measure the relative distance, compute the
+    control for the next tick, and update the jerk filter and the metrics. The jerk uses the same 1/20 s step
+    as the Dynamics object of main.py, so the metrics match analysis.compute_metrics on the telemetry of
+    run_simulated_scenario.
+
+    Example:
+        kt_p, kb_p = np.meshgrid(np.linspace(0.3, 0.8, 300), np.linspace(0.5, 1.0, 300))
+        metrics = run_batch_scenarios(kt_p=kt_p.ravel(), kb_p=kb_p.ravel())
+    """
+    scenario = resolve_scenario(**scenario)
+    if scenario['target_speed'] is None:
+        scenario['target_speed'] = np.nan
+    parameters = dict(zip(BATCH_PARAMETERS, (array.ravel() for array in np.broadcast_arrays(*(np.asarray(scenario[name], dtype=np.float64) for name in BATCH_PARAMETERS)))))
+    n = len(parameters['kt_p'])
+
+    half_lengths = VEHICLE_EXTENTS.get(scenario['ego_blueprint'], DEFAULT_EXTENT)[0] + VEHICLE_EXTENTS.get(scenario['target_blueprint'], DEFAULT_EXTENT)[0]
+
+    plant = BatchSimulator(n, fps=fps)
+    state = BatchDynamics(dt=(1/20), max_jerk=max_jerk)
+    metrics = BatchMetrics(n, time_step=plant.delta_seconds)
+    throttle = np.zeros(n)
+    brake = np.zeros(n)
+
+    for _ in range(frames):
+        plant.step(throttle, brake)
+
+        relative_distance = np.abs(parameters['initial_distance'] - plant.distance) - half_lengths
+        throttle, brake = Controller.range_controller_batch(relative_distance, plant.speed, parameters['desired_range'], parameters['kt_p'], parameters['kt_d'], parameters['kb_p'], parameters['target_speed'])
+
+        jerk = state.get_jerk(plant.acceleration)
+        metrics.update(relative_distance, plant.speed, plant.acceleration, jerk)
+
+    return {**parameters, **metrics.result()}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Run the CCRs scenario on the NumPy longitudinal model, without a CARLA server.')
+    parser.add_argument('--output', default='simulated.npz', help='telemetry output file (.csv or .npz)')
+    parser.add_argument('--frames', type=int, default=600, help='simulation frames')
+    parser.add_argument('--fps', type=int, default=30, help='simulation frames per second')
+    parser.add_argument('--initial-distance', type=float, default=None, help='initial distance in meters')
+    parser.add_argument('--kt-p', type=float, default=None, help='throttle proportional gain')
+    parser.add_argument('--kt-d', type=float, default=None, help='throttle derivative gain')
+    parser.add_argument('--kb-p', type=float, default=None, help='brake proportional gain')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    scenario = {name: value for name, value in (('initial_distance', args.initial_distance), ('kt_p', args.kt_p), ('kt_d', args.kt_d), ('kb_p', args.kb_p)) if value is not None}
+    frames = run_simulated_scenario(args.output, frames=args.frames, fps=args.fps, **scenario)
+    logging.info(f'{frames} frames simulated, telemetry written to {args.output}')
+
+
+if __name__ == '__main__':
+    logging.basicConfig(format='%(levelname)s: %(message)s', level=logging.INFO)
+    main()
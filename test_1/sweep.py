@@ -0,0 +1,174 @@
+import argparse
+import csv
+import itertools
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import carla
+
+import analysis
+from main import run_scenario
+from scenario import DEFAULT_SCENARIO
+
+logging.basicConfig(format='%(levelname)s: %(message)s', level=logging.INFO)
+
+SWEEP_PARAMETERS = ('initial_distance', 'target_speed', 'ego_blueprint', 'kt_p', 'kt_d', 'kb_p')
+
+# Client of the CARLA server owned by the current worker process
+_server = None
+_client = None
+
+
+def build_grid(initial_distances: list[float], target_speeds: list[float], ego_blueprints: list[str], gains: list[tuple[float, float, float]]) -> list[dict]:
+    """
+    Build the cartesian product of the sweep parameters.
+
+    Args:
+        initial_distances (list[float]): Spawn distances between the two vehicles' centers in meters.
+        target_speeds (list[float]): Cruise speeds in m/s, None for full throttle.
+        ego_blueprints (list[str]): Blueprint names of the ego vehicle.
+        gains (list[tuple[float, float, float]]): Controller gains (kt_p, kt_d, kb_p).
+
+    Returns:
+        list[dict]: One scenario dictionary per run, accepted by `main.run_scenario`.
+    """
+    grid = []
+    for initial_distance, target_speed, ego_blueprint, (kt_p, kt_d, kb_p) in itertools.product(initial_distances, target_speeds, ego_blueprints, gains):
+        grid.append({
+            'initial_distance': initial_distance,
+            'target_speed': target_speed,
+            'ego_blueprint': ego_blueprint,
+            'kt_p': kt_p,
+            'kt_d': kt_d,
+            'kb_p': kb_p,
+        })
+    return grid
+
+
+def parse_server(server: str) -> tuple[str, int]:
+    host, _, port = server.rpartition(':')
+    return host or 'localhost', int(port)
+
+
+def _init_worker(servers) -> None:
+    # Every worker process takes one server for its whole lifetime
+    global _server
+    _server = servers.get()
+
+
+def _get_client() -> carla.Client:
+    global _client
+    if _client is None:
+        _client = carla.Client(*_server)
+        _client.set_timeout(10.0)
+    return _client
+
+
+def run_job(index: int, scenario: dict, output_dir: str, frames: int, fps: int) -> dict:
+    """
+    Run one scenario of the sweep on the worker's CARLA server and compute its metrics.
+
+    Args:
+        index (int): Index of the run in the grid, used to name its telemetry file.
+        scenario (dict): Scenario parameters passed to `main.run_scenario`.
+        output_dir (str): Directory of the per-run telemetry files.
+        frames (int): Number of simulation frames of each run.
+        fps (int): Simulation frames per second.
+
+    Returns:
+        dict: The scenario parameters, the server, the telemetry file, the CCR metrics and the verdict.
+    """
+    telemetry_filename = os.path.join(output_dir, f'run_{index:05d}.npz')
+    result = {'run': index, 'server': '%s:%d' % _server, 'telemetry': telemetry_filename, **scenario}
+
+    try:
+        run_scenario(_get_client(), telemetry_filename, headless=True, frames=frames, fps=fps, **scenario)
+        metrics = analysis.compute_metrics(analysis.read_data(telemetry_filename), time_step=1.0 / fps)
+    except Exception as e:
+        logging.error(f'run {index} on {result["server"]} failed: {e}')
+        result['verdict'] = 'error'
+        return result
+
+    metrics.pop('run', None)
+    result.update(metrics)
+    result['verdict'] = 'collision' if metrics['min_relative_distance'] <= 0.0 else 'pass'
+    return result
+
+
+def run_sweep(grid: list[dict], servers: list[tuple[str, int]], output_dir: str, frames: int = 600, fps: int = 30) -> list[dict]:
+    """
+    Shard the grid across one worker process per CARLA server.
+
+    Args:
+        grid (list[dict]): Scenarios to run, as returned by `build_grid`.
+        servers (list[tuple[str, int]]): (host, port) of the CARLA servers, one worker each.
+        output_dir (str): Directory of the per-run telemetry files.
+        frames (int): Number of simulation frames of each run.
+        fps (int): Simulation frames per second.
+
+    Returns:
+        list[dict]: One result per run, in grid order.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+
+    with multiprocessing.Manager() as manager:
+        server_queue = manager.Queue()
+        for server in servers:
+            server_queue.put(server)
+
+        with ProcessPoolExecutor(max_workers=len(servers), initializer=_init_worker, initargs=(server_queue,)) as executor:
+            futures = [executor.submit(run_job, index, scenario, output_dir, frames, fps) for index, scenario in enumerate(grid)]
+            results = []
+            for future in futures:
+                result = future.result()
+                logging.info(f'run {result["run"]}/{len(grid)} on {result["server"]}: {result["verdict"]}')
+                results.append(result)
+    return results
+
+
+def write_results(results: list[dict], filename: str) -> None:
+    fields = ['run', 'server', 'telemetry', *SWEEP_PARAMETERS, *analysis.METRIC_FIELDS[1:], 'verdict']
+    with open(filename, 'w', newline='') as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=fields, extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(results)
+
+
+def parse_speed(value: str):
+    return None if value.lower() == 'none' else float(value)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Run a grid of CCRs scenarios in parallel on several CARLA servers.')
+    parser.add_argument('--servers', nargs='+', default=['localhost:2000'], help='host:port of every CARLA server')
+    parser.add_argument('--distances', nargs='+', type=float, default=[DEFAULT_SCENARIO['initial_distance']], help='initial distances in meters')
+    parser.add_argument('--speeds', nargs='+', type=parse_speed, default=[DEFAULT_SCENARIO['target_speed']], help='target speeds in m/s, "none" for full throttle')
+    parser.add_argument('--blueprints', nargs='+', default=[DEFAULT_SCENARIO['ego_blueprint']], help='ego vehicle blueprints')
+    parser.add_argument('--kt-p', nargs='+', type=float, default=[DEFAULT_SCENARIO['kt_p']], help='throttle proportional gains')
+    parser.add_argument('--kt-d', nargs='+', type=float, default=[DEFAULT_SCENARIO['kt_d']], help='throttle derivative gains')
+    parser.add_argument('--kb-p', nargs='+', type=float, default=[DEFAULT_SCENARIO['kb_p']], help='brake proportional gains')
+    parser.add_argument('--frames', type=int, default=600, help='simulation frames of each run')
+    parser.add_argument('--fps', type=int, default=30, help='simulation frames per second')
+    parser.add_argument('--output-dir', default='sweep', help='directory of the telemetry files and the results table')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    gains = list(itertools.product(args.kt_p, args.kt_d, args.kb_p))
+    grid = build_grid(args.distances, args.speeds, args.blueprints, gains)
+    servers = [parse_server(server) for server in args.servers]
+    logging.info(f'{len(grid)} runs on {len(servers)} servers')
+
+    results = run_sweep(grid, servers, args.output_dir, frames=args.frames, fps=args.fps)
+
+    results_filename = os.path.join(args.output_dir, 'results.csv')
+    write_results(results, results_filename)
+    logging.info(f'results written to {results_filename}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,212 @@
+import os
+import shutil
+import time
+
+import carla
+import numpy as np
+
+from telemetry_schema import BOX_FIELDS, BOX_PREFIX, TELEMETRY_FIELDS, box_filename, npz_parts_dir, read_npz_parts
+
+
+class TelemetryWriter(object):
+
+    """
+    Buffered writer for the per-tick telemetry rows of a simulation run.
+
+    The output file is opened once and kept open for the whole run. Rows are kept in memory
+    and written in batches, either when `flush_rows` rows are pending or when `flush_interval`
+    seconds have passed since the last flush. The header is written only when the file is empty,
+    so consecutive runs keep appending to the same file.
+
+    When the rows come with the boxes of all the targets, they are written to a second CSV file
+    (see box_filename) with one line per box, in BOX_FIELDS order. Its `row` column is the index
+    of the telemetry row in the main file.
+
+    Attributes:
+        filename (str): Path of the output CSV file.
+        flush_rows (int): Number of pending rows that triggers a flush.
+        flush_interval (float): Maximum time in seconds between two flushes.
+
+    Methods:
+        open: Opens the output file and writes the header if needed.
+        write: Buffers a single telemetry row.
+        flush: Writes all the pending rows to the file.
+        close: Flushes the pending rows and closes the file.
+
+    Example:
+        with TelemetryWriter('data.csv', flush_rows=100) as telemetry:
+            telemetry.write(velocity, acceleration, jerk, relative_distance, bbox, boxes=visualizer.get_bboxes())
+    """
+
+    def __init__(self, filename: str, flush_rows: int = 100, flush_interval: float = 1.0):
+        self.filename = filename
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self._file = None
+        self._box_file = None
+        self._rows = []
+        self._box_blocks = []
+        self._row_count = 0
+        self._last_flush = time.monotonic()
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, *args, **kwargs):
+        self.close()
+
+    def open(self) -> None:
+        if self._file is not None:
+            return
+        self._file = open(self.filename, 'a+')
+        if self._file.tell() == 0:
+            self._file.write(','.join(TELEMETRY_FIELDS) + '\n')
+            self._row_count = 0
+        else:
+            # Appending to a previous run, the box rows continue its row numbering
+            self._file.seek(0)
+            self._row_count = sum(1 for _ in self._file) - 1
+            self._file.seek(0, os.SEEK_END)
+        self._last_flush = time.monotonic()
+
+    def write(self, velocity: carla.Vector3D, acceleration: carla.Vector3D, jerk: list[float], relative_distance: float, bbox: list[float], boxes: tuple[np.ndarray, np.ndarray] = None) -> None:
+        """
+        Buffer a telemetry row, flushing to disk when the row count or time threshold is reached.
+
+        Args:
+            velocity (carla.Vector3D): The velocity of the ego vehicle.
+            acceleration (carla.Vector3D): The acceleration of the ego vehicle.
+            jerk (list[float]): The jerk components [jerk_x, jerk_y, jerk_z].
+            relative_distance (float): The relative distance to the target vehicle in meters.
+            bbox (list[float]): The bounding box [x_min, x_max, y_min, y_max] in pixels.
+            boxes (tuple[np.ndarray, np.ndarray], optional): The actor ids (n_targets,) and the boxes
+                [x_min, y_min, x_max, y_max] (n_targets, 4) of all the targets, as returned by
+                `Visualizer.get_bboxes`. Defaults to None (no box table).
+        """
+        if boxes is not None and len(boxes[0]):
+            actor_ids, target_boxes = boxes
+            block = np.empty((len(actor_ids), len(BOX_FIELDS)))
+            block[:, 0] = self._row_count + len(self._rows)
+            block[:, 1] = actor_ids
+            block[:, 2:] = target_boxes
+            self._box_blocks.append(block)
+
+        self._rows.append((
+            velocity.x, velocity.y, velocity.z,
+            acceleration.x, acceleration.y, acceleration.z,
+            jerk[0], jerk[1], jerk[2],
+            relative_distance,
+            bbox[0], bbox[3], bbox[1], bbox[3], bbox[0], bbox[2], bbox[1], bbox[2]))
+
+        if len(self._rows) >= self.flush_rows or time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self) -> None:
+        if self._file is None:
+            self.open()
+        if self._box_blocks:
+            self._flush_boxes(np.concatenate(self._box_blocks))
+            self._box_blocks.clear()
+        if self._rows:
+            self._file.writelines(','.join(map(str, row)) + '\n' for row in self._rows)
+            self._row_count += len(self._rows)
+            self._rows.clear()
+        self._file.flush()
+        self._last_flush = time.monotonic()
+
+    def _flush_boxes(self, table: np.ndarray) -> None:
+        # The box file is only created by the runs that log boxes
+        if self._box_file is None:
+            self._box_file = open(box_filename(self.filename), 'a')
+            if self._box_file.tell() == 0:
+                self._box_file.write(','.join(BOX_FIELDS) + '\n')
+        self._box_file.writelines(f'{int(row[0])},{int(row[1])},{row[2]},{row[3]},{row[4]},{row[5]}\n' for row in table.tolist())
+        self._box_file.flush()
+
+    def close(self) -> None:
+        if self._file is None and not self._rows:
+            return
+        self.flush()
+        self._file.close()
+        self._file = None
+        if self._box_file is not None:
+            self._box_file.close()
+            self._box_file = None
+
+
+class NpzTelemetryWriter(TelemetryWriter):
+
+    """
+    Columnar binary variant of TelemetryWriter.
+
+    Rows are buffered the same way as in TelemetryWriter, but each flush appends the pending rows as a
+    typed float64 block to a raw part file (see npz_parts_dir), so a crashed or killed run keeps its
+    flushed rows and analysis can still read them. On close, the parts are stored as a compressed NPZ
+    archive with one array per telemetry column, using the same names as the CSV header, and removed.
+    The box table, when logged, is stored in the same archive as one array per BOX_FIELDS column,
+    prefixed with BOX_PREFIX. Unlike the CSV writer, each run overwrites the output file.
+
+    Example:
+        with NpzTelemetryWriter('data.npz') as telemetry:
+            telemetry.write(velocity, acceleration, jerk, relative_distance, bbox)
+    """
+
+    def __init__(self, filename: str, flush_rows: int = 100, flush_interval: float = 1.0):
+        super().__init__(filename, flush_rows, flush_interval)
+        self.parts_dir = npz_parts_dir(filename)
+
+    def open(self) -> None:
+        if self._file is not None:
+            return
+        os.makedirs(self.parts_dir, exist_ok=True)
+        self._file = open(os.path.join(self.parts_dir, 'rows.f64'), 'wb')
+        self._box_file = open(os.path.join(self.parts_dir, 'boxes.f64'), 'wb')
+        self._row_count = 0
+        self._last_flush = time.monotonic()
+
+    def flush(self) -> None:
+        if self._file is None:
+            self.open()
+        if self._box_blocks:
+            self._box_file.write(np.concatenate(self._box_blocks).tobytes())
+            self._box_file.flush()
+            self._box_blocks.clear()
+        if self._rows:
+            self._file.write(np.array(self._rows, dtype=np.float64).tobytes())
+            self._row_count += len(self._rows)
+            self._rows.clear()
+        self._file.flush()
+        self._last_flush = time.monotonic()
+
+    def close(self) -> None:
+        if self._file is None and not self._rows:
+            return
+        self.flush()
+        self._file.close()
+        self._box_file.close()
+        self._file = None
+        self._box_file = None
+
+        table, boxes = read_npz_parts(self.filename)
+        columns = {name: table[:, i] for i, name in enumerate(TELEMETRY_FIELDS)}
+        if len(boxes):
+            columns.update({BOX_PREFIX + name: boxes[:, i].astype(np.int64) if name in ('row', 'actor_id') else boxes[:, i] for i, name in enumerate(BOX_FIELDS)})
+        np.savez_compressed(self.filename, **columns)
+        shutil.rmtree(self.parts_dir)
+
+
+def make_telemetry_writer(filename: str, **kwargs) -> TelemetryWriter:
+    """
+    Create a telemetry writer matching the extension of the output file.
+
+    Args:
+        filename (str): Path of the output file, `.npz` selects the columnar binary format, anything else CSV.
+        **kwargs: Forwarded to the writer constructor (flush_rows, flush_interval).
+
+    Returns:
+        TelemetryWriter: The telemetry writer for the requested format.
+    """
+    if os.path.splitext(filename)[1].lower() == '.npz':
+        return NpzTelemetryWriter(filename, **kwargs)
+    return TelemetryWriter(filename, **kwargs)
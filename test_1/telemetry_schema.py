@@ -0,0 +1,69 @@
+# Columns of the telemetry files, shared by the writers (telemetry.py) and the readers (analysis.py).
+# Kept free of carla so the analysis runs without the simulator package.
+
+import os
+
+import numpy as np
+
+TELEMETRY_FIELDS = (
+    'velocity_x', 'velocity_y', 'velocity_z',
+    'acceleration_x', 'acceleration_y', 'acceleration_z',
+    'jerk_x', 'jerk_y', 'jerk_z',
+    'relative_distance',
+    'bbox_top_left_x', 'bbox_top_left_y',
+    'bbox_top_right_x', 'bbox_top_right_y',
+    'bbox_bottom_left_x', 'bbox_bottom_left_y',
+    'bbox_bottom_right_x', 'bbox_bottom_right_y',
+)
+
+# Ragged table of all the bounding boxes, one row per box, keyed by telemetry row and actor id
+BOX_FIELDS = ('row', 'actor_id', 'x_min', 'y_min', 'x_max', 'y_max')
+BOX_PREFIX = 'boxes_'
+
+
+def box_filename(filename: str) -> str:
+    """
+    Path of the bounding box table written next to a CSV telemetry file.
+
+    Args:
+        filename (str): Path of the telemetry CSV file.
+
+    Returns:
+        str: The path of the box table, e.g. `data_boxes.csv` for `data.csv`.
+    """
+    stem, extension = os.path.splitext(filename)
+    return f'{stem}_{BOX_PREFIX[:-1]}{extension}'
+
+
+def npz_parts_dir(filename: str) -> str:
+    """
+    Directory of the raw parts streamed by the NPZ writer while a run is in progress.
+
+    Args:
+        filename (str): Path of the telemetry NPZ archive.
+
+    Returns:
+        str: The path of the parts directory, e.g. `data.npz.parts` for `data.npz`. It holds `rows.f64`
+        and `boxes.f64`, the float64 telemetry and box rows appended at every flush. The writer removes it
+        once the archive is written, so it only remains after an interrupted run.
+    """
+    return filename + '.parts'
+
+
+def read_npz_parts(filename: str) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Read the raw parts of an NPZ telemetry run, e.g. to recover a run interrupted before its archive was written.
+
+    Args:
+        filename (str): Path of the telemetry NPZ archive.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: The telemetry rows, shape (N, len(TELEMETRY_FIELDS)), and the box rows,
+        shape (M, len(BOX_FIELDS)). A row cut short by the interruption is dropped.
+    """
+    tables = []
+    for name, fields in (('rows.f64', TELEMETRY_FIELDS), ('boxes.f64', BOX_FIELDS)):
+        path = os.path.join(npz_parts_dir(filename), name)
+        table = np.fromfile(path, dtype=np.float64) if os.path.exists(path) else np.empty(0)
+        tables.append(table[:len(table) - len(table) % len(fields)].reshape(-1, len(fields)))
+    return tables[0], tables[1]
@@ -0,0 +1,10 @@
+import os
+import sys
+
+# The scenario modules import each other by name, and `carla` resolves to the fake module
+TEST_1_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FAKE_CARLA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fake_carla')
+
+for path in (TEST_1_DIR, FAKE_CARLA_DIR):
+    if path not in sys.path:
+        sys.path.insert(0, path)
@@ -0,0 +1,322 @@
+"""
+Minimal stand-in for the `carla` package, enough to drive `main.run_scenario` in headless mode without a server.
+
+Put this directory first on the path (sys.path or PYTHONPATH) so `import carla` resolves here. The world
+moves the vehicles with simulated physics along their forward vector, with a crude longitudinal model of
+the throttle and the brake, and delivers a snapshot to the on_tick callbacks on every tick.
+"""
+
+import fnmatch
+import itertools
+import math
+
+
+class Vector3D(object):
+
+    def __init__(self, x: float = 0.0, y: float = 0.0, z: float = 0.0):
+        self.x = float(x)
+        self.y = float(y)
+        self.z = float(z)
+
+    def __add__(self, other):
+        return type(self)(self.x + other.x, self.y + other.y, self.z + other.z)
+
+    def __sub__(self, other):
+        return type(self)(self.x - other.x, self.y - other.y, self.z - other.z)
+
+    def __mul__(self, scale: float):
+        return type(self)(self.x * scale, self.y * scale, self.z * scale)
+
+    def dot(self, other) -> float:
+        return self.x * other.x + self.y * other.y + self.z * other.z
+
+    def length(self) -> float:
+        return math.sqrt(self.dot(self))
+
+    def __repr__(self):
+        return f'{type(self).__name__}(x={self.x}, y={self.y}, z={self.z})'
+
+
+class Location(Vector3D):
+
+    def distance(self, other) -> float:
+        return (self - other).length()
+
+
+class Rotation(object):
+
+    def __init__(self, pitch: float = 0.0, yaw: float = 0.0, roll: float = 0.0):
+        self.pitch = float(pitch)
+        self.yaw = float(yaw)
+        self.roll = float(roll)
+
+
+class Transform(object):
+
+    def __init__(self, location: Location = None, rotation: Rotation = None):
+        self.location = location if location is not None else Location()
+        self.rotation = rotation if rotation is not None else Rotation()
+
+    def get_forward_vector(self) -> Vector3D:
+        pitch, yaw = math.radians(self.rotation.pitch), math.radians(self.rotation.yaw)
+        return Vector3D(math.cos(pitch) * math.cos(yaw), math.cos(pitch) * math.sin(yaw), math.sin(pitch))
+
+    def get_matrix(self) -> list[list[float]]:
+        # Same convention as carla.Transform.get_matrix, see projection.transform_matrices
+        cp, sp = math.cos(math.radians(self.rotation.pitch)), math.sin(math.radians(self.rotation.pitch))
+        cy, sy = math.cos(math.radians(self.rotation.yaw)), math.sin(math.radians(self.rotation.yaw))
+        cr, sr = math.cos(math.radians(self.rotation.roll)), math.sin(math.radians(self.rotation.roll))
+        return [
+            [cp * cy, cy * sp * sr - sy * cr, -cy * sp * cr - sy * sr, self.location.x],
+            [cp * sy, sy * sp * sr + cy * cr, -sy * sp * cr + cy * sr, self.location.y],
+            [sp, -cp * sr, cp * cr, self.location.z],
+            [0.0, 0.0, 0.0, 1.0],
+        ]
+
+    def get_inverse_matrix(self) -> list[list[float]]:
+        matrix = self.get_matrix()
+        rotation = [[matrix[j][i] for j in range(3)] for i in range(3)]
+        translation = [matrix[i][3] for i in range(3)]
+        rows = [row + [-sum(r * t for r, t in zip(row, translation))] for row in rotation]
+        return rows + [[0.0, 0.0, 0.0, 1.0]]
+
+
+class BoundingBox(object):
+
+    def __init__(self, location: Location, extent: Vector3D):
+        self.location = location
+        self.extent = extent
+
+
+class VehicleControl(object):
+
+    def __init__(self, throttle: float = 0.0, steer: float = 0.0, brake: float = 0.0, hand_brake: bool = False, reverse: bool = False, manual_gear_shift: bool = False):
+        self.throttle = throttle
+        self.steer = steer
+        self.brake = brake
+        self.hand_brake = hand_brake
+        self.reverse = reverse
+        self.manual_gear_shift = manual_gear_shift
+
+
+class WorldSettings(object):
+
+    def __init__(self, no_rendering_mode: bool = False, synchronous_mode: bool = False, fixed_delta_seconds: float = None):
+        self.no_rendering_mode = no_rendering_mode
+        self.synchronous_mode = synchronous_mode
+        self.fixed_delta_seconds = fixed_delta_seconds
+
+
+class Image(object):
+
+    """Placeholder of the camera image type, the fake world has no camera data."""
+
+
+class RadarMeasurement(object):
+
+    """Placeholder of the radar measurement type, the fake world has no radar data."""
+
+
+class RadarDetection(object):
+
+    """Placeholder of the radar detection type."""
+
+
+class ActorAttribute(object):
+
+    def __init__(self, value: str):
+        self.value = value
+
+    def as_int(self) -> int:
+        return int(self.value)
+
+    def as_float(self) -> float:
+        return float(self.value)
+
+
+class ActorBlueprint(object):
+
+    def __init__(self, blueprint_id: str):
+        self.id = blueprint_id
+        self._attributes = {}
+
+    def set_attribute(self, key: str, value: str) -> None:
+        self._attributes[key] = value
+
+    def get_attribute(self, key: str) -> ActorAttribute:
+        return ActorAttribute(self._attributes[key])
+
+
+class BlueprintLibrary(object):
+
+    def find(self, blueprint_id: str) -> ActorBlueprint:
+        return ActorBlueprint(blueprint_id)
+
+
+class ActorSnapshot(object):
+
+    def __init__(self, actor):
+        self.id = actor.id
+        self._transform = actor.get_transform()
+        self._velocity = actor.get_velocity()
+        self._acceleration = actor.get_acceleration()
+
+    def get_transform(self) -> Transform:
+        return self._transform
+
+    def get_velocity(self) -> Vector3D:
+        return self._velocity
+
+    def get_acceleration(self) -> Vector3D:
+        return self._acceleration
+
+    def get_angular_velocity(self) -> Vector3D:
+        return Vector3D()
+
+
+class WorldSnapshot(object):
+
+    def __init__(self, frame: int, actors):
+        self.frame = frame
+        self._actors = {actor.id: ActorSnapshot(actor) for actor in actors}
+
+    def find(self, actor_id: int) -> ActorSnapshot:
+        return self._actors.get(actor_id)
+
+
+class Actor(object):
+
+    # Bounding box extent of every fake vehicle, in meters
+    EXTENT = (2.3, 1.0, 0.8)
+    MAX_ACCELERATION = 4.0  # m/s^2 at full throttle
+    MAX_DECELERATION = 8.0  # m/s^2 at full brake
+
+    def __init__(self, world, actor_id: int, type_id: str, transform: Transform, parent=None):
+        self.id = actor_id
+        self.type_id = type_id
+        self.parent = parent
+        self.bounding_box = BoundingBox(Location(), Vector3D(*self.EXTENT))
+        self.is_alive = True
+        self.simulate_physics = True
+        self.speed = 0.0
+        self.acceleration = 0.0
+        self._world = world
+        self._transform = transform
+        self._control = VehicleControl()
+
+    def get_transform(self) -> Transform:
+        return self._transform
+
+    def get_location(self) -> Location:
+        return self._transform.location
+
+    def get_velocity(self) -> Vector3D:
+        return self._transform.get_forward_vector() * self.speed
+
+    def get_acceleration(self) -> Vector3D:
+        return self._transform.get_forward_vector() * self.acceleration
+
+    def set_simulate_physics(self, enabled: bool) -> None:
+        self.simulate_physics = enabled
+
+    def apply_control(self, control: VehicleControl) -> None:
+        self._control = control
+
+    def listen(self, callback) -> None:
+        pass
+
+    def destroy(self) -> bool:
+        self.is_alive = False
+        self._world._actors.pop(self.id, None)
+        return True
+
+    def _step(self, dt: float) -> None:
+        if not self.simulate_physics or self.parent is not None:
+            return
+        self.acceleration = self.MAX_ACCELERATION * self._control.throttle - self.MAX_DECELERATION * self._control.brake
+        speed = max(self.speed + self.acceleration * dt, 0.0)
+        forward = self._transform.get_forward_vector()
+        self._transform = Transform(self._transform.location + forward * (0.5 * (self.speed + speed) * dt), self._transform.rotation)
+        self.speed = speed
+
+
+class ActorList(list):
+
+    def filter(self, pattern: str):
+        return ActorList(actor for actor in self if fnmatch.fnmatch(actor.type_id, pattern))
+
+
+# Annotation-only types, every fake actor is an Actor
+Vehicle = Sensor = Camera = Actor
+
+
+class Map(object):
+
+    def __init__(self, name: str):
+        self.name = name
+
+
+class World(object):
+
+    def __init__(self, town: str = 'Carla/Maps/Town02'):
+        self.town = town
+        self.frame = 0
+        self._settings = WorldSettings()
+        self._actors = {}
+        self._ids = itertools.count(1)
+        self._callbacks = []
+
+    def get_map(self) -> Map:
+        return Map(self.town)
+
+    def get_settings(self) -> WorldSettings:
+        return self._settings
+
+    def apply_settings(self, settings: WorldSettings) -> int:
+        self._settings = settings
+        return self.frame
+
+    def get_blueprint_library(self) -> BlueprintLibrary:
+        return BlueprintLibrary()
+
+    def spawn_actor(self, blueprint: ActorBlueprint, transform: Transform, attach_to: Actor = None) -> Actor:
+        actor = Actor(self, next(self._ids), blueprint.id, transform, parent=attach_to)
+        self._actors[actor.id] = actor
+        return actor
+
+    def get_actors(self) -> ActorList:
+        return ActorList(self._actors.values())
+
+    def get_snapshot(self) -> WorldSnapshot:
+        return WorldSnapshot(self.frame, self._actors.values())
+
+    def on_tick(self, callback) -> None:
+        self._callbacks.append(callback)
+
+    def tick(self, seconds: float = 10.0) -> int:
+        dt = self._settings.fixed_delta_seconds or 0.05
+        for actor in self._actors.values():
+            actor._step(dt)
+        self.frame += 1
+        snapshot = self.get_snapshot()
+        for callback in self._callbacks:
+            callback(snapshot)
+        return self.frame
+
+
+class Client(object):
+
+    def __init__(self, host: str = 'localhost', port: int = 2000):
+        self.host = host
+        self.port = port
+        self._world = World()
+
+    def set_timeout(self, seconds: float) -> None:
+        pass
+
+    def get_world(self) -> World:
+        return self._world
+
+    def load_world(self, town: str) -> World:
+        self._world = World(town)
+        return self._world
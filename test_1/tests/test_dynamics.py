@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+
+import carla
+from dynamics import BatchDynamics, Dynamics, savgol_coefficients
+
+
+class Vehicle(object):
+    # Only the acceleration is read by the jerk filter
+
+    def __init__(self):
+        self.acceleration = carla.Vector3D()
+
+    def get_acceleration(self):
+        return self.acceleration
+
+
+def reference_jerk(samples, window=5, dt=0.05):
+    # Moving average over a growing history, as the list based filter did before the ring buffer
+    jerks = []
+    previous = None
+    for i in range(len(samples)):
+        filtered = samples[max(i + 1 - window, 0):i + 1].mean(axis=0) if i + 1 >= window else samples[i]
+        jerks.append(np.zeros(3) if previous is None else np.clip((filtered - previous) / dt, -10, 10))
+        previous = filtered
+    return np.array(jerks)
+
+
+def run_filter(dynamics, vehicle, samples):
+    jerks = []
+    for sample in samples:
+        vehicle.acceleration = carla.Vector3D(*sample)
+        jerks.append(dynamics.get_jerk(vehicle))
+    return np.array(jerks)
+
+
+def test_moving_average_matches_the_list_filter():
+    samples = np.random.default_rng(0).normal(size=(500, 3))
+    vehicle = Vehicle()
+    jerks = run_filter(Dynamics(vehicle, dt=0.05), vehicle, samples)
+    np.testing.assert_allclose(jerks, reference_jerk(samples), atol=1e-12)
+
+
+def test_batch_dynamics_matches_dynamics():
+    samples = np.random.default_rng(1).normal(size=(200, 3))
+    vehicle = Vehicle()
+    jerks = run_filter(Dynamics(vehicle, dt=0.05), vehicle, samples)
+    batch = BatchDynamics(dt=0.05)
+    np.testing.assert_allclose([batch.get_jerk(sample) for sample in samples], jerks, atol=1e-12)
+
+
+def test_savgol_coefficients_reproduce_a_polynomial():
+    weights = savgol_coefficients(7, 2)
+    t = np.arange(-6, 1, dtype=np.float64)
+    assert weights @ (3.0 + 2.0 * t - 0.5 * t ** 2) == pytest.approx(3.0)
+    assert weights.sum() == pytest.approx(1.0)
+
+
+def test_savgol_follows_a_ramp_without_lag():
+    vehicle = Vehicle()
+    dynamics = Dynamics(vehicle, dt=0.05, filter_type='savgol', filter_window_size=5, polyorder=2)
+    jerks = run_filter(dynamics, vehicle, [(0.1 * i, 0.0, 0.0) for i in range(20)])
+    np.testing.assert_allclose(jerks[1:, 0], 0.1 / 0.05, atol=1e-9)
+
+
+def test_exponential_filter_smooths_a_step():
+    vehicle = Vehicle()
+    dynamics = Dynamics(vehicle, dt=0.05, filter_type='exponential', smoothing=0.5)
+    jerks = run_filter(dynamics, vehicle, [(0.0, 0.0, 0.0)] + [(0.1, 0.0, 0.0)] * 3)
+    np.testing.assert_allclose(jerks[1:, 0], [1.0, 0.5, 0.25])
+
+
+def test_invalid_filter_is_rejected():
+    with pytest.raises(ValueError):
+        Dynamics(Vehicle(), filter_type='median')
+    with pytest.raises(ValueError):
+        Dynamics(Vehicle(), filter_type='savgol', filter_window_size=3, polyorder=3)
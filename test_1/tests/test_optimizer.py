@@ -0,0 +1,27 @@
+import numpy as np
+
+from optimizer import pareto_front
+
+
+def brute_force_front(gap_error, peak_jerk):
+    front = []
+    for i in range(len(gap_error)):
+        dominated = (gap_error <= gap_error[i]) & (peak_jerk <= peak_jerk[i]) & ((gap_error < gap_error[i]) | (peak_jerk < peak_jerk[i]))
+        if not dominated.any():
+            front.append(i)
+    return front
+
+
+def test_pareto_front():
+    gap_error = np.array([1.0, 2.0, 0.5, 3.0, 0.5])
+    peak_jerk = np.array([5.0, 1.0, 8.0, 0.5, 9.0])
+    np.testing.assert_array_equal(pareto_front(gap_error, peak_jerk), [2, 0, 1, 3])
+
+
+def test_pareto_front_matches_brute_force():
+    rng = np.random.default_rng(3)
+    gap_error = rng.random(300)
+    peak_jerk = rng.random(300)
+    front = pareto_front(gap_error, peak_jerk)
+    assert sorted(front.tolist()) == brute_force_front(gap_error, peak_jerk)
+    assert np.all(np.diff(gap_error[front]) >= 0.0)
@@ -0,0 +1,67 @@
+import numpy as np
+
+import carla
+from projection import box_world_vertices, build_projection_matrix, project_points, spheres_in_frustum, transform_matrices
+
+
+def scalar_projection(point, K, w2c):
+    # Single point projection of the CARLA bounding box tutorial
+    camera = w2c @ np.append(point, 1.0)
+    camera = np.array([camera[1], -camera[2], camera[0]])
+    image = K @ camera
+    return image[:2] / image[2]
+
+
+def random_transforms(count, seed=0):
+    rng = np.random.default_rng(seed)
+    locations = rng.uniform(-50.0, 50.0, size=(count, 3))
+    rotations = rng.uniform(-180.0, 180.0, size=(count, 3))
+    return locations, rotations
+
+
+def test_build_projection_matrix():
+    K = build_projection_matrix(1920, 1080, 90)
+    np.testing.assert_allclose(K, [[960.0, 0.0, 960.0], [0.0, 960.0, 540.0], [0.0, 0.0, 1.0]])
+
+
+def test_project_points_matches_the_scalar_projection():
+    K = build_projection_matrix(1920, 1080, 90)
+    w2c = np.array(carla.Transform(carla.Location(1.0, 2.0, 1.5), carla.Rotation(pitch=-5.0, yaw=30.0)).get_inverse_matrix())
+    points = np.random.default_rng(2).uniform(-40.0, 40.0, size=(100, 3))
+
+    pixels, visible = project_points(points, K, w2c)
+
+    np.testing.assert_allclose(pixels, [scalar_projection(point, K, w2c) for point in points], rtol=1e-10, atol=1e-8)
+    depth = (points @ np.asarray(w2c)[:3, :3].T + np.asarray(w2c)[:3, 3])[:, 0]
+    np.testing.assert_array_equal(visible, depth > 1e-6)
+
+
+def test_project_points_image_bounds():
+    K = build_projection_matrix(1920, 1080, 90)
+    pixels, visible = project_points(np.array([[10.0, 0.0, 0.0], [10.0, 20.0, 0.0], [-10.0, 0.0, 0.0]]), K, np.identity(4), image_size=(1920, 1080))
+    np.testing.assert_allclose(pixels[0], [960.0, 540.0])
+    np.testing.assert_array_equal(visible, [True, False, False])
+
+
+def test_transform_matrices_match_carla_transform():
+    locations, rotations = random_transforms(20)
+    expected = [carla.Transform(carla.Location(*location), carla.Rotation(*rotation)).get_matrix() for location, rotation in zip(locations, rotations)]
+    np.testing.assert_allclose(transform_matrices(locations, rotations), expected, atol=1e-12)
+
+
+def test_box_world_vertices():
+    matrices = transform_matrices(np.array([[10.0, 0.0, 0.0]]), np.array([[0.0, 90.0, 0.0]]))
+    vertices = box_world_vertices(matrices, np.array([[0.0, 0.0, 1.0]]), np.array([[2.0, 1.0, 0.5]]))
+    # A 90 degree yaw turns the length of the box along y
+    np.testing.assert_allclose(vertices[0].min(axis=0), [9.0, -2.0, 0.5], atol=1e-12)
+    np.testing.assert_allclose(vertices[0].max(axis=0), [11.0, 2.0, 1.5], atol=1e-12)
+
+
+def test_spheres_in_frustum_is_conservative():
+    K = build_projection_matrix(800, 600, 90)
+    w2c = np.identity(4)
+    centers = np.array([[20.0, 0.0, 0.0], [-20.0, 0.0, 0.0], [20.0, 60.0, 0.0], [20.0, 21.0, 0.0], [-1.0, 0.0, 0.0]])
+    radii = np.array([1.0, 1.0, 1.0, 2.0, 2.0])
+    # In front, behind, far outside the side plane, straddling it, straddling the camera plane
+    np.testing.assert_array_equal(spheres_in_frustum(centers, radii, K, w2c), [True, False, False, True, True])
+    np.testing.assert_array_equal(spheres_in_frustum(centers[:1], radii[:1], K, w2c, far=10.0), [False])
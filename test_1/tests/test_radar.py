@@ -0,0 +1,96 @@
+import numpy as np
+import pytest
+
+from controller import Controller
+from radar import RadarRangeEstimator, RangeKalmanFilter, cluster_ranges, decimate, decode_radar, radar_to_sensor
+
+RADAR_RANGE = 100.0
+DT = 0.05
+
+
+class Measurement(object):
+    # Stand-in of carla.RadarMeasurement: raw_data of float32 (velocity, azimuth, altitude, depth) rows
+
+    def __init__(self, detections, timestamp):
+        self.raw_data = np.asarray(detections, dtype=np.float32).reshape(-1, 4).tobytes()
+        self.timestamp = timestamp
+
+
+def lead_vehicle(depth, velocity=-5.0):
+    # A few detections on the rear of a vehicle straight ahead
+    return [(velocity, azimuth, 0.0, depth + 0.1 * i) for i, azimuth in enumerate((-0.02, 0.0, 0.02))]
+
+
+def test_decode_radar_keeps_the_detection_layout():
+    detections = [(-1.0, 0.1, -0.05, 12.0), (2.0, -0.2, 0.0, 30.0)]
+    points = decode_radar(Measurement(detections, 0.0))
+    assert points.dtype == np.float32
+    np.testing.assert_allclose(points, detections, rtol=1e-6)
+    assert decode_radar(Measurement([], 0.0)).shape == (0, 4)
+
+
+def test_radar_to_sensor():
+    points = np.array([[0.0, 0.0, 0.0, 10.0], [0.0, np.pi / 2, 0.0, 5.0], [0.0, 0.0, np.pi / 6, 4.0]])
+    np.testing.assert_allclose(radar_to_sensor(points), [[10.0, 0.0, 0.0], [0.0, 5.0, 0.0], [4.0 * np.cos(np.pi / 6), 0.0, 2.0]], atol=1e-12)
+
+
+def test_cluster_ranges_and_decimate():
+    np.testing.assert_array_equal(cluster_ranges(np.array([5.0, 5.5, 6.0, 9.0, 9.2, 20.0]), gap=1.0), [0, 0, 0, 1, 1, 2])
+    np.testing.assert_array_equal(decimate(5, None), np.arange(5))
+    np.testing.assert_array_equal(decimate(101, 3), [0, 50, 100])
+
+
+def test_measure_picks_the_nearest_large_cluster():
+    estimator = RadarRangeEstimator(mount_height=0.8)
+    # A single stray detection closer than the vehicle, one out of the lane and one below the ground
+    detections = [(-5.0, 0.0, 0.0, 8.0), (0.0, 0.5, 0.0, 6.0), (0.0, 0.0, -0.2, 7.0)] + lead_vehicle(15.0, velocity=-3.0)
+    distance, velocity = estimator.measure(decode_radar(Measurement(detections, 0.0)))
+    assert distance == pytest.approx(15.0 * np.cos(0.02), rel=1e-6)
+    assert velocity == pytest.approx(-3.0)
+
+
+def test_kalman_filter_converges_and_predicts():
+    kf = RangeKalmanFilter(n=2)
+    rng = np.random.default_rng(4)
+    for step in range(100):
+        kf.predict(DT)
+        truth = np.array([[50.0 - 5.0 * DT * step, -5.0], [20.0, 0.0]])
+        # The second target is only measured for the first half
+        kf.update(truth + rng.normal(scale=(0.1, 0.25), size=(2, 2)), mask=[True, step < 50])
+    assert kf.x[0, 0] == pytest.approx(50.0 - 5.0 * DT * 99, abs=0.2)
+    assert kf.x[0, 1] == pytest.approx(-5.0, abs=0.5)
+    assert kf.P[1, 0, 0] > kf.P[0, 0, 0]
+    kf.reset([False, True])
+    np.testing.assert_array_equal(kf.initialized, [True, False])
+
+
+def test_control_distance_before_first_detection():
+    estimator = RadarRangeEstimator(mount_height=0.8)
+    estimator.update(Measurement([], 0.0))
+    assert estimator.get_control_distance(default=RADAR_RANGE) == RADAR_RANGE
+
+
+def test_dropout_does_not_raise_throttle():
+    estimator = RadarRangeEstimator(mount_height=0.8, range_offset=0.05, max_misses=3)
+    speed = 5.0
+
+    # Track a lead vehicle closing at 5 m/s down to 15 m
+    timestamp = 0.0
+    for step in range(20):
+        timestamp = step * DT
+        estimator.update(Measurement(lead_vehicle(20.0 - speed * timestamp), timestamp))
+    tracked = estimator.get_control_distance(default=RADAR_RANGE)
+    assert abs(tracked - 15.0) < 0.5
+
+    # The radar loses the vehicle for longer than max_misses, the track is dropped
+    throttles = [Controller.range_controller(tracked, speed, kt_p=0.56, kt_d=0.015, kb_p=0.75).throttle]
+    distances = []
+    for step in range(20, 40):
+        timestamp = step * DT
+        distance, _ = estimator.update(Measurement([], timestamp))
+        distances.append(estimator.get_control_distance(default=RADAR_RANGE))
+        throttles.append(Controller.range_controller(distances[-1], speed, kt_p=0.56, kt_d=0.015, kb_p=0.75).throttle)
+
+    assert np.isnan(distance)
+    assert max(distances) < 20.0
+    assert np.all(np.diff(throttles) <= 0.0)
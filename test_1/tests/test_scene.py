@@ -0,0 +1,47 @@
+import queue
+import threading
+
+import pytest
+
+from scene import SensorQueue
+
+
+class Measurement(object):
+
+    def __init__(self, frame):
+        self.frame = frame
+
+
+def test_full_queue_drops_the_oldest():
+    sensor_queue = SensorQueue(maxsize=2)
+    for frame in range(1, 5):
+        sensor_queue.put(Measurement(frame))
+    assert sensor_queue.dropped == 2
+    assert sensor_queue.get(3, timeout=0.1).frame == 3
+    assert sensor_queue.last.frame == 3
+
+
+def test_older_frames_are_stale():
+    sensor_queue = SensorQueue(maxsize=4)
+    for frame in range(1, 4):
+        sensor_queue.put(Measurement(frame))
+    assert sensor_queue.get(3, timeout=0.1).frame == 3
+    assert sensor_queue.stale == 2
+    assert sensor_queue.dropped == 0
+
+
+def test_missing_frame_is_late():
+    sensor_queue = SensorQueue(maxsize=4)
+    sensor_queue.put(Measurement(1))
+    with pytest.raises(queue.Empty):
+        sensor_queue.get(2, timeout=0.01)
+    assert sensor_queue.late == 1
+    assert sensor_queue.stale == 1
+
+
+def test_get_waits_for_the_frame():
+    sensor_queue = SensorQueue(maxsize=4)
+    timer = threading.Timer(0.05, sensor_queue.put, args=(Measurement(7),))
+    timer.start()
+    assert sensor_queue.get(7, timeout=2.0).frame == 7
+    timer.join()
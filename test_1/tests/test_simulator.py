@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+
+import analysis
+from simulator import BatchSimulator, longitudinal_step, run_batch_scenarios, run_simulated_scenario
+
+
+def test_longitudinal_step_arrays_match_scalars():
+    speeds = np.array([0.0, 5.0, 20.0, 0.5])
+    accelerations = np.array([0.0, 1.0, -2.0, -3.0])
+    throttles = np.array([1.0, 0.3, 0.0, 0.0])
+    brakes = np.array([0.0, 0.0, 0.7, 1.0])
+
+    batch = longitudinal_step(speeds, accelerations, throttles, brakes, 0.05)
+    for i in range(len(speeds)):
+        scalar = longitudinal_step(speeds[i], accelerations[i], throttles[i], brakes[i], 0.05)
+        for batch_value, scalar_value in zip(batch, scalar):
+            assert batch_value[i] == pytest.approx(float(scalar_value))
+
+
+def test_braking_stops_without_reversing():
+    plant = BatchSimulator(1, fps=20)
+    plant.speed[:] = 1.0
+    for _ in range(100):
+        plant.step(np.zeros(1), np.ones(1))
+    assert plant.speed[0] == 0.0
+    assert plant.distance[0] > 0.0
+
+
+@pytest.mark.parametrize('initial_distance', [60.0, 105.0])
+def test_batch_metrics_match_the_scalar_telemetry(tmp_path, initial_distance):
+    filename = str(tmp_path / 'run.npz')
+    run_simulated_scenario(filename, frames=300, fps=30, initial_distance=initial_distance)
+    expected = analysis.compute_metrics(analysis.read_data(filename), time_step=1.0 / 30)
+
+    metrics = run_batch_scenarios(frames=300, fps=30, initial_distance=np.array([initial_distance]))
+    for name, value in expected.items():
+        np.testing.assert_allclose(metrics[name][0], value, rtol=1e-9, atol=1e-9, err_msg=name)
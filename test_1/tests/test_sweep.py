@@ -0,0 +1,31 @@
+import csv
+import os
+
+import pytest
+
+import sweep
+from conftest import FAKE_CARLA_DIR, TEST_1_DIR
+
+
+@pytest.fixture
+def worker_path(monkeypatch):
+    # The worker processes import the scenario modules and the fake carla through PYTHONPATH
+    paths = [FAKE_CARLA_DIR, TEST_1_DIR, os.environ.get('PYTHONPATH', '')]
+    monkeypatch.setenv('PYTHONPATH', os.pathsep.join(path for path in paths if path))
+
+
+def test_run_sweep_on_two_servers(tmp_path, worker_path):
+    grid = sweep.build_grid([30.0, 60.0], [None], ['vehicle.bmw.grandtourer'], [(0.56, 0.015, 0.75)])
+    servers = [sweep.parse_server('localhost:2000'), sweep.parse_server('localhost:2002')]
+
+    results = sweep.run_sweep(grid, servers, str(tmp_path), frames=60, fps=20)
+    results_filename = os.path.join(tmp_path, 'results.csv')
+    sweep.write_results(results, results_filename)
+
+    with open(results_filename, newline='') as csvfile:
+        rows = list(csv.DictReader(csvfile))
+    assert [int(row['run']) for row in rows] == [0, 1]
+    assert [float(row['initial_distance']) for row in rows] == [30.0, 60.0]
+    assert {row['server'] for row in rows} <= {'localhost:2000', 'localhost:2002'}
+    assert all(row['verdict'] in ('pass', 'collision') for row in rows)
+    assert all(os.path.exists(row['telemetry']) for row in rows)
@@ -0,0 +1,59 @@
+import os
+
+import numpy as np
+import pytest
+
+import analysis
+import carla
+from telemetry import TelemetryWriter, make_telemetry_writer
+from telemetry_schema import TELEMETRY_FIELDS
+
+
+def write_rows(telemetry, count):
+    for i in range(count):
+        telemetry.write(carla.Vector3D(0.0, -float(i), 0.0), carla.Vector3D(0.0, 1.0, 0.0), [0.0, 0.5, 0.0], 100.0 - i, [1.0, 2.0, 3.0, 4.0], boxes=(np.array([7]), np.array([[1.0, 3.0, 2.0, 4.0]])))
+
+
+@pytest.mark.parametrize('extension', ['.csv', '.npz'])
+def test_round_trip(tmp_path, extension):
+    filename = str(tmp_path / f'run{extension}')
+    with make_telemetry_writer(filename, flush_rows=4) as telemetry:
+        write_rows(telemetry, 10)
+
+    data = analysis.read_data(filename)
+    assert data.dtype.names == TELEMETRY_FIELDS
+    np.testing.assert_array_equal(data['velocity_y'], -np.arange(10.0))
+    np.testing.assert_array_equal(data['relative_distance'], 100.0 - np.arange(10))
+    np.testing.assert_array_equal(data['bbox_top_left_x'], 1.0)
+    np.testing.assert_array_equal(data['bbox_bottom_right_y'], 3.0)
+
+    boxes = analysis.read_boxes(filename)
+    np.testing.assert_array_equal(boxes['row'], np.arange(10))
+    np.testing.assert_array_equal(boxes['actor_id'], 7)
+    np.testing.assert_array_equal(boxes['x_max'], 2.0)
+
+
+def test_csv_appends_continue_the_box_rows(tmp_path):
+    filename = str(tmp_path / 'run.csv')
+    for _ in range(2):
+        with TelemetryWriter(filename) as telemetry:
+            write_rows(telemetry, 3)
+    assert len(analysis.read_data(filename)) == 6
+    np.testing.assert_array_equal(analysis.read_boxes(filename)['row'], np.arange(6))
+
+
+def test_npz_rows_survive_an_interrupted_run(tmp_path):
+    filename = str(tmp_path / 'run.npz')
+    telemetry = make_telemetry_writer(filename, flush_rows=10)
+    write_rows(telemetry, 25)
+
+    # Killed before close, the flushed rows are read from the parts
+    assert not os.path.exists(filename)
+    assert analysis.find_runs([str(tmp_path)]) == [filename]
+    assert np.array_equal(analysis.read_data(filename)['relative_distance'], 100.0 - np.arange(20))
+    assert len(analysis.read_boxes(filename)) == 20
+
+    telemetry.close()
+    assert os.path.exists(filename)
+    assert not os.path.exists(filename + '.parts')
+    assert len(analysis.read_data(filename)) == 25
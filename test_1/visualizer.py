@@ -3,6 +3,8 @@ import cv2
 import carla
 import pygame
 
+from projection import box_world_vertices, build_projection_matrix, locations_to_array, project_points, spheres_in_frustum, transform_matrices
+
 class Visualizer:
 
     """
@@ -13,33 +15,66 @@ class Visualizer:
     to image-space coordinates. It uses OpenCV and Pygame for image processing and display.
 
     Attributes:
-        camera (carla.Camera): The camera sensor used for capturing images.
+        camera (carla.Camera): The camera sensor used for capturing images, None for a virtual camera.
+        parent (carla.Actor): Actor carrying the virtual camera when no camera sensor is spawned.
+        camera_transform (carla.Transform): Pose of the virtual camera relative to its parent.
         clock: Pygame clock object for controlling frame rate.
         world_2_camera (np.ndarray): Transformation matrix from world to camera coordinates.
+        display (bool): Whether the annotated frames are drawn and shown in an OpenCV window.
+        max_distance (float): Vehicles farther than this from the ego vehicle are not boxed, in meters.
+        box_ids (np.ndarray): Actor ids of the vehicles boxed on the last frame, shape (n_targets,).
+        boxes (np.ndarray): Their boxes [x_min, y_min, x_max, y_max] in pixels, shape (n_targets, 4).
 
     Methods:
         build_projection_matrix: Build a perspective projection matrix for camera.
         get_image_point: Convert world-space location to image-space coordinates.
+        get_world_2_camera: Get the current world-to-camera transformation matrix.
+        get_frame: Copy the camera image into the reusable frame buffer.
+        track_vehicles: Cache the ids and bounding boxes of the vehicles to box, once at spawn.
         draw_bbox: Draw bounding boxes around nearby vehicles in camera images.
+        show_frame: Show an annotated frame in the OpenCV window.
         get_bbox_vertices: Get the bounding box vertices.
+        get_bboxes: Get the boxes of all the targets, keyed by actor id.
         __del__: Destructor method to close OpenCV windows.
 
     Example:
         # Create a Visualizer instance
         visualizer = Visualizer(camera_sensor, camera_bp)
 
+        # Or, without a camera sensor, project from a virtual camera attached to the ego vehicle
+        visualizer = Visualizer(None, camera_bp, display=False, parent=ego_vehicle, camera_transform=camera_transform)
+
         # Draw bounding boxes around nearby vehicles in camera images
         visualizer.draw_bbox(image_front, world, ego_vehicle, relative_distance)
 
+        # Or, with dense traffic, cache the vehicles once and read their poses from the tick snapshot
+        visualizer.track_vehicles([stationary_vehicle, *traffic])
+        visualizer.draw_bbox(image_front, world, ego_state, relative_distance, states=states)
+
         # Get bounding box vertices
         bbox_vertices = visualizer.get_bbox_vertices()
     """
 
-    def __init__(self, camera, camera_bp):
-        pygame.init()
+    def __init__(self, camera, camera_bp, display: bool = True, parent: carla.Actor = None, camera_transform: carla.Transform = None, max_distance: float = 100.0):
+        if display:
+            pygame.init()
         self.camera = camera
+        self.parent = parent
+        self.camera_transform = camera_transform
+        self.display = display
+        self.max_distance = max_distance
+        self._frame_buffer = None
+        self._target_ids = np.empty(0, dtype=np.int64)
+        self._target_centers = np.empty((0, 3))
+        self._target_extents = np.empty((0, 3))
+        self.box_ids = np.empty(0, dtype=np.int64)
+        self.boxes = np.empty((0, 4))
         self.clock = pygame.time.Clock()
-        self.world_2_camera = np.array(camera.get_transform().get_inverse_matrix())
+        if camera is None and (parent is None or camera_transform is None):
+            raise ValueError('a virtual camera needs both a parent actor and a relative camera transform')
+        if camera_transform is not None:
+            self._parent_2_camera = np.array(camera_transform.get_inverse_matrix())
+        self.world_2_camera = self.get_world_2_camera()
         
         image_w = camera_bp.get_attribute("image_size_x").as_int()
         image_h = camera_bp.get_attribute("image_size_y").as_int()
@@ -76,12 +111,7 @@ class Visualizer:
             #        [   0.        ,    0.        ,    1.        ]])
 
         """
-        focal = w / (2.0 * np.tan(fov * np.pi / 360.0))
-        K = np.identity(3)
-        K[0, 0] = K[1, 1] = focal
-        K[0, 2] = w / 2.0
-        K[1, 2] = h / 2.0
-        return K
+        return build_projection_matrix(w, h, fov)
     
     @staticmethod
     def get_image_point(loc: carla.Location, K: np.ndarray, w2c: np.ndarray) -> list[float]:
@@ -98,8 +128,8 @@ class Visualizer:
 
         This method transforms a given world-space location into image-space coordinates
         using the provided camera intrinsic matrix (K) and world-to-camera transformation
-        matrix (w2c). It performs the necessary matrix multiplications and normalization
-        to map the 3D point onto the 2D image plane.
+        matrix (w2c). It is a single point wrapper around `projection.project_points`, prefer
+        the batched version when projecting several points.
 
         Example:
             loc = carla.Location(x=10.0, y=20.0, z=5.0)  # World-space location
@@ -114,81 +144,198 @@ class Visualizer:
             print(img_point)
             # Output: [960.0, 540.0]
         """
-        point = np.array([loc.x, loc.y, loc.z, 1])
-        point_camera = np.dot(w2c, point)
-        point_camera = [point_camera[1], -point_camera[2], point_camera[0]]
+        pixels, _ = project_points(locations_to_array([loc]), K, w2c)
+        return pixels[0]
+    
+    def get_world_2_camera(self, states: dict = None) -> np.ndarray:
+        """
+        Get the current world-to-camera transformation matrix.
 
-        point_img = np.dot(K, point_camera)
+        Args:
+            states (dict, optional): Current ActorState of the actors keyed by actor id (see
+                actor_state.ActorStateCache). The camera or parent pose is read from it when present.
 
-        point_img[0] /= point_img[2]
-        point_img[1] /= point_img[2]
+        Returns:
+            np.ndarray: The world-to-camera transformation matrix (4x4).
 
-        return point_img[0:2]
-    
-    def draw_bbox(self, image_front: carla.Image, world: carla.World, vehicle: carla.Vehicle, relative_distance: float) -> None:
+        With a camera sensor the matrix is read from the sensor pose. With a virtual camera it is
+        composed from the parent pose and the relative camera transform, so no sensor and no image
+        data are needed to compute the bounding boxes.
+        """
+        if self.camera is not None:
+            return np.array(self._get_transform(self.camera, states).get_inverse_matrix())
+        return self._parent_2_camera @ np.array(self._get_transform(self.parent, states).get_inverse_matrix())
+
+    @staticmethod
+    def _get_transform(actor: carla.Actor, states: dict = None) -> carla.Transform:
+        # Prefer the snapshot of the current tick over a round trip to the server
+        state = states.get(actor.id) if states else None
+        return state.get_transform() if state is not None else actor.get_transform()
+
+    def get_frame(self, image: carla.Image) -> np.ndarray:
+        """
+        Copy a camera image into the reusable BGRA frame buffer.
+
+        Args:
+            image (carla.Image): Camera image.
+
+        Returns:
+            np.ndarray: Writable (height, width, 4) frame, reused between calls.
+
+        The raw data is wrapped with `np.frombuffer` without copying, and then copied once into a
+        buffer that is allocated on the first frame and reused as long as the resolution is unchanged.
+        """
+        frame = np.frombuffer(image.raw_data, dtype=np.uint8).reshape((image.height, image.width, 4))
+        if self._frame_buffer is None or self._frame_buffer.shape != frame.shape:
+            self._frame_buffer = np.empty_like(frame)
+        np.copyto(self._frame_buffer, frame)
+        return self._frame_buffer
+
+    def track_vehicles(self, vehicles) -> None:
+        """
+        Cache the vehicles to box, with their ids and bounding boxes, once at spawn.
+
+        Args:
+            vehicles: Iterable of carla.Vehicle (or ActorState) spawned in the world. Calling it again adds more vehicles.
+
+        Once vehicles are tracked, `draw_bbox` no longer lists the world actors on every frame. It reads
+        the poses of the tracked vehicles from the tick states (or a single world snapshot), culls them by
+        distance and camera frustum as arrays, and projects the remaining boxes in one batch.
+        """
+        vehicles = [vehicle for vehicle in vehicles if vehicle.id not in self._target_ids]
+        if not vehicles:
+            return
+        self._target_ids = np.concatenate((self._target_ids, [vehicle.id for vehicle in vehicles]))
+        self._target_centers = np.concatenate((self._target_centers, locations_to_array(vehicle.bounding_box.location for vehicle in vehicles)))
+        self._target_extents = np.concatenate((self._target_extents, locations_to_array(vehicle.bounding_box.extent for vehicle in vehicles)))
+
+    def _get_tracked_boxes(self, world: carla.World, vehicle_id: int, ego_transform: carla.Transform, world_2_camera: np.ndarray, states: dict = None) -> tuple[np.ndarray, np.ndarray]:
+        # Poses of the tracked vehicles from the tick states, or from one world snapshot for the others
+        rows = []
+        poses = []
+        world_snapshot = None
+        for row, actor_id in enumerate(self._target_ids.tolist()):
+            if actor_id == vehicle_id:
+                continue
+            state = states.get(actor_id) if states else None
+            if state is None:
+                if world_snapshot is None:
+                    world_snapshot = world.get_snapshot()
+                state = world_snapshot.find(actor_id)
+                if state is None:
+                    continue
+            transform = state.get_transform()
+            rows.append(row)
+            poses.append((transform.location.x, transform.location.y, transform.location.z, transform.rotation.pitch, transform.rotation.yaw, transform.rotation.roll))
+
+        if not rows:
+            return np.empty(0, dtype=np.int64), np.empty((0, 4))
+        rows = np.array(rows)
+        poses = np.array(poses)
+
+        # Vehicles in front of the ego vehicle, within max_distance and inside the camera frustum
+        ego_location = ego_transform.location
+        forward_vec = ego_transform.get_forward_vector()
+        rays = poses[:, :3] - (ego_location.x, ego_location.y, ego_location.z)
+        matrices = transform_matrices(poses[:, :3], poses[:, 3:])
+        centers = np.einsum('nij,nj->ni', matrices[:, :3, :3], self._target_centers[rows]) + matrices[:, :3, 3]
+        keep = (rays @ (forward_vec.x, forward_vec.y, forward_vec.z) > 1) & (np.linalg.norm(rays, axis=1) < self.max_distance)
+        keep &= spheres_in_frustum(centers, np.linalg.norm(self._target_extents[rows], axis=1), self.K, world_2_camera)
+        rows = rows[keep]
+
+        # Project the 8 vertices of all the remaining boxes at once
+        verts = box_world_vertices(matrices[keep], self._target_centers[rows], self._target_extents[rows])
+        points, _ = project_points(verts.reshape(-1, 3), self.K, world_2_camera)
+        points = points.reshape(-1, 8, 2)
+        return self._target_ids[rows], np.concatenate((points.min(axis=1), points.max(axis=1)), axis=1)
+
+    def draw_bbox(self, image_front: carla.Image, world: carla.World, vehicle: carla.Vehicle, relative_distance: float, states: dict = None, show: bool = True) -> np.ndarray:
 
         """
         Draw bounding boxes around nearby vehicles in the input image.
 
         Args:
-            image_front (carla.Image): Front-facing camera image.
+            image_front (carla.Image): Front-facing camera image, may be None when display is disabled.
             world (carla.World): Carla world object.
-            vehicle (carla.Vehicle): Ego vehicle.
+            vehicle (carla.Vehicle): Ego vehicle, or its ActorState.
             relative_distance (float): Relative distance to other vehicles.
+            states (dict, optional): Current ActorState of the actors keyed by actor id. The poses of the
+                ego vehicle, the camera and the other vehicles are read from it instead of the server.
+            show (bool): Show the annotated frame. Pass False when called off the main thread, HighGUI is
+                not thread-safe, and show the returned frame with `show_frame` on the main thread.
+
+        Returns:
+            np.ndarray: The annotated BGRA frame, held in the reused frame buffer, or None when nothing was drawn.
 
         This method draws bounding boxes around nearby vehicles detected in the input image.
         The bounding boxes are drawn only for vehicles within a certain relative distance.
         The method filters out the ego vehicle to avoid drawing its bounding box.
+        When display is disabled only the bounding box is computed and the image pixels are never touched.
+        Every pose is read once per call. When vehicles are tracked (see `track_vehicles`) only those are
+        boxed, culled as arrays by their own distance to the ego vehicle instead of relative_distance.
 
         Example:
             # Assuming 'image_front', 'world', 'vehicle', and 'relative_distance' are defined
             scene.draw_bbox(image_front, world, vehicle, relative_distance)
         """
 
-        img = np.reshape(np.copy(image_front.raw_data), (image_front.height, image_front.width, 4))
-        world_2_camera = np.array(self.camera.get_transform().get_inverse_matrix())
+        world_2_camera = self.get_world_2_camera(states)
+        ego_transform = self._get_transform(vehicle, states)
+        forward_vec = ego_transform.get_forward_vector()
 
-        for npc in world.get_actors().filter('*vehicle*'):
+        if len(self._target_ids):
+            self.box_ids, self.boxes = self._get_tracked_boxes(world, vehicle.id, ego_transform, world_2_camera, states)
+        else:
+            box_ids = []
+            verts = []
+            for npc in world.get_actors().filter('*vehicle*'):
 
-            # Filter out the ego vehicle
-            if npc.id != vehicle.id:
+                # Filter out the ego vehicle
+                if npc.id != vehicle.id:
 
-                bb = npc.bounding_box
-                dist = relative_distance
+                    bb = npc.bounding_box
+                    dist = relative_distance
 
-                if dist < 100.0:
+                    if dist < self.max_distance:
 
-                    forward_vec = vehicle.get_transform().get_forward_vector()
-                    ray = npc.get_transform().location - vehicle.get_transform().location
+                        npc_transform = self._get_transform(npc, states)
+                        ray = npc_transform.location - ego_transform.location
 
-                    if forward_vec.dot(ray) > 1:
-                        # p1 = self.get_image_point(bb.location, self.K, world_2_camera) #http://host.robots.ox.ac.uk/pascal/VOC/
-                        verts = [v for v in bb.get_world_vertices(npc.get_transform())]
-                        self.x_max = -10000
-                        self.x_min = 10000
-                        self.y_max = -10000
-                        self.y_min = 10000
+                        if forward_vec.dot(ray) > 1:
+                            # p1 = self.get_image_point(bb.location, self.K, world_2_camera) #http://host.robots.ox.ac.uk/pascal/VOC/
+                            box_ids.append(npc.id)
+                            verts.append(locations_to_array(bb.get_world_vertices(npc_transform)))
 
-                        for vert in verts:
-                            p = self.get_image_point(vert, self.K, world_2_camera)
-                            # Find the rightmost vertex
-                            if p[0] > self.x_max:
-                                self.x_max = p[0]
-                            # Find the leftmost vertex
-                            if p[0] < self.x_min:
-                                self.x_min = p[0]
-                            # Find the highest vertex
-                            if p[1] > self.y_max:
-                                self.y_max = p[1]
-                            # Find the lowest  vertex
-                            if p[1] < self.y_min:
-                                self.y_min = p[1]
+            # Project the 8 vertices of all the boxes at once and keep the extreme pixel coordinates
+            points, _ = project_points(np.concatenate(verts) if verts else np.empty((0, 3)), self.K, world_2_camera)
+            points = points.reshape(-1, 8, 2)
+            self.box_ids = np.array(box_ids, dtype=np.int64)
+            self.boxes = np.concatenate((points.min(axis=1), points.max(axis=1)), axis=1) if len(points) else np.empty((0, 4))
 
-                        cv2.line(img, (int(self.x_min),int(self.y_min)), (int(self.x_max),int(self.y_min)), (0,0,255, 255), 1)
-                        cv2.line(img, (int(self.x_min),int(self.y_max)), (int(self.x_max),int(self.y_max)), (0,0,255, 255), 1)
-                        cv2.line(img, (int(self.x_min),int(self.y_min)), (int(self.x_min),int(self.y_max)), (0,0,255, 255), 1)
-                        cv2.line(img, (int(self.x_max),int(self.y_min)), (int(self.x_max),int(self.y_max)), (0,0,255, 255), 1)
+        # The single box kept for the CSV schema is the last one, as before
+        if len(self.boxes):
+            self.x_min, self.y_min, self.x_max, self.y_max = self.boxes[-1].tolist()
 
+        # Nothing to draw on when the camera frame was skipped
+        if not self.display or image_front is None:
+            return None
+
+        img = self.get_frame(image_front)
+        for x_min, y_min, x_max, y_max in self.boxes.astype(int).tolist():
+            cv2.rectangle(img, (x_min, y_min), (x_max, y_max), (0,0,255, 255), 1)
+
+        if show:
+            self.show_frame(img)
+        return img
+
+    @staticmethod
+    def show_frame(img: np.ndarray) -> None:
+        """
+        Show an annotated frame in the OpenCV window, must be called on the main thread.
+
+        Args:
+            img (np.ndarray): Frame returned by `draw_bbox`.
+        """
         cv2.imshow('Bounding Box Image',img)
         cv2.waitKey(1)
 
@@ -215,8 +362,23 @@ class Visualizer:
                 return [0, 0, 0, 0]
         return verdicts
 
+    def get_bboxes(self) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Get the boxes of all the vehicles boxed on the last frame.
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]: The actor ids, shape (n_targets,), and the boxes
+            [x_min, y_min, x_max, y_max] in pixels, shape (n_targets, 4), in the same order.
+
+        Example:
+            actor_ids, boxes = visualizer.get_bboxes()
+            telemetry.write(velocity, acceleration, jerk, relative_distance, bbox, boxes=(actor_ids, boxes))
+        """
+        return self.box_ids, self.boxes
+
     def __del__(self):
-        cv2.destroyAllWindows()
+        if self.display:
+            cv2.destroyAllWindows()
 
     # Bounding box docs: https://carla.readthedocs.io/en/latest/tuto_G_bounding_boxes/
  
\ No newline at end of file
@@ -74,6 +74,9 @@ try:
 except IndexError:
     pass
 
+# shared helpers (batched camera projection) live next to the test_1 scenario
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'test_1'))
+
 
 # ==============================================================================
 # -- imports -------------------------------------------------------------------
@@ -89,8 +92,10 @@ import collections
 import datetime
 import logging
 import math
+import queue
 import random
 import re
+import threading
 import weakref
 
 try:
@@ -143,6 +148,9 @@ try:
 except ImportError:
     raise RuntimeError('cannot import numpy, make sure numpy package is installed')
 
+from projection import build_projection_matrix, locations_to_array, project_points
+from radar import decimate, decode_radar, radar_to_world, velocity_colors
+
 # ==============================================================================
 # -- Global functions ----------------------------------------------------------
 # ==============================================================================
@@ -667,82 +675,75 @@ class LaneDetector(object):
         self.world = world.world
         self.vehicle = world.player
         self.map = self.world.get_map()
+        self.waypoint_index = self.build_waypoint_index(self.map)
 
-        self.K = self.build_projection_matrix(world.camera_manager.sensor_width, world.camera_manager.sensor_height, world.camera_manager.sensor_fov)
+        self.K = build_projection_matrix(world.camera_manager.sensor_width, world.camera_manager.sensor_height, world.camera_manager.sensor_fov)
         
     def detect(self, camera):
         self.world_2_camera = np.array(camera.get_transform().get_inverse_matrix())
 
-        left_lane_points = []
-        right_lane_points = []
-
-        all_waypoints = self.map.generate_waypoints(distance=1.0)
-
         location = self.vehicle.get_location()
 
         nearest_waypoint = self.map.get_waypoint(location, project_to_road=True)
 
-        waypoints_on_map = self.get_nearest_waypoints_same_lane(nearest_waypoint, all_waypoints)
+        waypoints_on_map = self.get_nearest_waypoints_same_lane(nearest_waypoint)
 
         if len(waypoints_on_map) == 0:
             return (0, 0), (0, 0)
-        
-        else:
-            for waypoint_on_map in waypoints_on_map:
-                left_lane_waypoint =  waypoint_on_map.get_left_lane()
-                right_lane_waypoint = waypoint_on_map.get_right_lane()
 
-                try:
-                    left_lane_location = left_lane_waypoint.transform.location
-                    right_lane_location = right_lane_waypoint.transform.location
-                except Exception as e:
-                    if "'NoneType' object has no attribute 'transform'" in str(e):
-                        return (0, 0), (0, 0)
-                                        
-                left_lane_point = self.get_image_point(left_lane_location, self.K, self.world_2_camera)
-                right_lane_point = self.get_image_point(right_lane_location, self.K, self.world_2_camera)
-
-                left_lane_points.append((int(left_lane_point[0]), int(left_lane_point[1])))
-                right_lane_points.append((int(right_lane_point[0]), int(right_lane_point[1])))
+        lane_locations = []
+        for waypoint_on_map in waypoints_on_map:
+            left_lane_waypoint =  waypoint_on_map.get_left_lane()
+            right_lane_waypoint = waypoint_on_map.get_right_lane()
 
-        return left_lane_points, right_lane_points
+            if left_lane_waypoint is None or right_lane_waypoint is None:
+                return (0, 0), (0, 0)
 
-    @staticmethod
-    def get_image_point(loc, K, w2c):
-        point = np.array([loc.x, loc.y, loc.z, 1])
-        point_camera = np.dot(w2c, point)
+            lane_locations.append(left_lane_waypoint.transform.location)
+            lane_locations.append(right_lane_waypoint.transform.location)
 
-        point_camera = [point_camera[1], -point_camera[2], point_camera[0]]
+        # Project all the lane points with a single matrix product, rows alternate left/right
+        points, _ = project_points(locations_to_array(lane_locations), self.K, self.world_2_camera)
+        points = points.astype(int)
 
-        point_img = np.dot(K, point_camera)
+        left_lane_points = [tuple(point) for point in points[0::2].tolist()]
+        right_lane_points = [tuple(point) for point in points[1::2].tolist()]
 
-        point_img[0] /= point_img[2]
-        point_img[1] /= point_img[2]
+        return left_lane_points, right_lane_points
 
-        return point_img[0:2]
-    
     @staticmethod
-    def build_projection_matrix(w, h, fov):
-        focal = w / (2.0 * np.tan(fov * np.pi / 360.0))
-        K = np.identity(3)
-        K[0, 0] = K[1, 1] = focal
-        K[0, 2] = w / 2.0
-        K[1, 2] = h / 2.0
-        return K
-    
-    def get_nearest_waypoints_same_lane(self, nearest_waypoint, all_waypoints, k=20):
-        distances_and_waypoints = []
+    def get_image_point(loc, K, w2c):
+        points, _ = project_points(locations_to_array([loc]), K, w2c)
+        return points[0]
 
-        for waypoint in all_waypoints:
-            if waypoint.road_id == nearest_waypoint.road_id and waypoint.lane_id == nearest_waypoint.lane_id:
-                distance = math.sqrt((waypoint.transform.location.x - nearest_waypoint.transform.location.x)**2 + (waypoint.transform.location.y - nearest_waypoint.transform.location.y)**2)
-                distances_and_waypoints.append((distance, waypoint))
+    @staticmethod
+    def build_waypoint_index(carla_map, distance=1.0):
+        # Generate the map waypoints once, grouped by (road_id, lane_id) and sorted by their arc-length s
+        lanes = collections.defaultdict(list)
+        for waypoint in carla_map.generate_waypoints(distance=distance):
+            lanes[(waypoint.road_id, waypoint.lane_id)].append(waypoint)
+
+        waypoint_index = {}
+        for key, waypoints in lanes.items():
+            waypoints.sort(key=lambda waypoint: waypoint.s)
+            s_values = np.array([waypoint.s for waypoint in waypoints])
+            waypoint_index[key] = (waypoints, s_values)
+        return waypoint_index
+
+    def get_nearest_waypoints_same_lane(self, nearest_waypoint, k=20):
+        lane = self.waypoint_index.get((nearest_waypoint.road_id, nearest_waypoint.lane_id))
+        if lane is None:
+            return []
+        waypoints, s_values = lane
 
-        # Sort the list based on distances
-        distances_and_waypoints.sort()
+        # Only the k waypoints on each side of the arc-length position can be among the k nearest
+        center = np.searchsorted(s_values, nearest_waypoint.s)
+        start = max(center - k, 0)
+        stop = min(center + k, len(s_values))
+        distances = np.abs(s_values[start:stop] - nearest_waypoint.s)
 
         # Return the first k waypoints (the nearest ones)
-        return [waypoint for (_, waypoint) in distances_and_waypoints[:k]]
+        return [waypoints[start + i] for i in np.argsort(distances, kind='stable')[:k]]
 
 # ==============================================================================
 # -- HUD -----------------------------------------------------------------------
@@ -789,8 +790,7 @@ class HUD(object):
         heading += 'S' if 90.5 < compass < 269.5 else ''
         heading += 'E' if 0.5 < compass < 179.5 else ''
         heading += 'W' if 180.5 < compass < 359.5 else ''
-        colhist = world.collision_sensor.get_collision_history()
-        collision = [colhist[x + self.frame - 200] for x in range(0, 200)]
+        collision = world.collision_sensor.get_collision_history(self.frame)
         max_col = max(1.0, max(collision))
         collision = [x / max_col for x in collision]
         vehicles = world.world.get_actors().filter('vehicle.*')
@@ -964,9 +964,16 @@ class HelpText(object):
 
 
 class CollisionSensor(object):
+    # Frames of the summed intensities kept for the HUD plot
+    history_frames = 200
+
     def __init__(self, parent_actor, hud):
         self.sensor = None
-        self.history = []
+        self.history = collections.deque(maxlen=4000)
+        # Ring of the summed intensity per frame, tagged with its frame. It is twice the plotted window so
+        # that collisions reported ahead of the HUD frame do not overwrite frames still plotted
+        self._intensities = np.zeros(2 * self.history_frames)
+        self._frames = np.full(2 * self.history_frames, -1, dtype=np.int64)
         self._parent = parent_actor
         self.hud = hud
         world = self._parent.get_world()
@@ -977,11 +984,11 @@ class CollisionSensor(object):
         weak_self = weakref.ref(self)
         self.sensor.listen(lambda event: CollisionSensor._on_collision(weak_self, event))
 
-    def get_collision_history(self):
-        history = collections.defaultdict(int)
-        for frame, intensity in self.history:
-            history[frame] += intensity
-        return history
+    def get_collision_history(self, frame):
+        # Summed intensity of each of the history_frames frames before `frame`, 0 without collision
+        frames = np.arange(frame - self.history_frames, frame)
+        slots = frames % len(self._frames)
+        return np.where(self._frames[slots] == frames, self._intensities[slots], 0.0).tolist()
 
     @staticmethod
     def _on_collision(weak_self, event):
@@ -993,8 +1000,11 @@ class CollisionSensor(object):
         impulse = event.normal_impulse
         intensity = math.sqrt(impulse.x**2 + impulse.y**2 + impulse.z**2)
         self.history.append((event.frame, intensity))
-        if len(self.history) > 4000:
-            self.history.pop(0)
+        slot = event.frame % len(self._frames)
+        if self._frames[slot] != event.frame:
+            self._frames[slot] = event.frame
+            self._intensities[slot] = 0.0
+        self._intensities[slot] += intensity
 
 
 # ==============================================================================
@@ -1109,6 +1119,9 @@ class RadarSensor(object):
         bound_z = 0.5 + self._parent.bounding_box.extent.z
 
         self.velocity_range = 7.5 # m/s
+        # Cap of the points drawn per measurement, every draw_point is a call to the server
+        self.max_points = 100
+        self.points = np.empty((0, 4), dtype=np.float32)
         world = self._parent.get_world()
         self.debug = world.debug
         bp = world.get_blueprint_library().find('sensor.other.radar')
@@ -1130,33 +1143,19 @@ class RadarSensor(object):
         self = weak_self()
         if not self:
             return
-        # To get a numpy [[vel, altitude, azimuth, depth],...[,,,]]:
-        # points = np.frombuffer(radar_data.raw_data, dtype=np.dtype('f4'))
-        # points = np.reshape(points, (len(radar_data), 4))
-
-        current_rot = radar_data.transform.rotation
-        for detect in radar_data:
-            azi = math.degrees(detect.azimuth)
-            alt = math.degrees(detect.altitude)
-            # The 0.25 adjusts a bit the distance so the dots can
-            # be properly seen
-            fw_vec = carla.Vector3D(x=detect.depth - 0.25)
-            carla.Transform(
-                carla.Location(),
-                carla.Rotation(
-                    pitch=current_rot.pitch + alt,
-                    yaw=current_rot.yaw + azi,
-                    roll=current_rot.roll)).transform(fw_vec)
-
-            def clamp(min_v, max_v, value):
-                return max(min_v, min(value, max_v))
-
-            norm_velocity = detect.velocity / self.velocity_range # range [-1, 1]
-            r = int(clamp(0.0, 1.0, 1.0 - norm_velocity) * 255.0)
-            g = int(clamp(0.0, 1.0, 1.0 - abs(norm_velocity)) * 255.0)
-            b = int(abs(clamp(- 1.0, 0.0, - 1.0 - norm_velocity)) * 255.0)
+        # numpy [[vel, azimuth, altitude, depth],...[,,,]], all the detections are kept for other consumers,
+        # copied since the view into raw_data is freed once the callback returns
+        self.points = decode_radar(radar_data).copy()
+        points = self.points[decimate(len(self.points), self.max_points)]
+
+        # The 0.25 adjusts a bit the distance so the dots can
+        # be properly seen
+        locations = radar_to_world(points, radar_data.transform, depth_offset=-0.25)
+        colors = velocity_colors(points[:, 0], self.velocity_range)
+
+        for (x, y, z), (r, g, b) in zip(locations.tolist(), colors.tolist()):
             self.debug.draw_point(
-                radar_data.transform.location + fw_vec,
+                carla.Location(x=x, y=y, z=z),
                 size=0.075,
                 life_time=0.06,
                 persistent_lines=False,
@@ -1174,6 +1173,19 @@ class CameraManager(object):
         self._parent = parent_actor
         self.hud = hud
         self.recording = False
+        self.dropped_frames = 0
+        self.dropped_recordings = 0
+        # The sensor callback only queues the latest image, a worker converts it into the back surface
+        self._pending = queue.Queue(maxsize=1)
+        # While recording, the callback queues every image for a writer, which saves it before passing it on
+        # to the converter (the conversion changes the image in place)
+        self._recordings = queue.Queue(maxsize=64)
+        self._surfaces = {}
+        self._surface_lock = threading.Lock()
+        self._generation = 0
+        self._lidar_pool = {}
+        self._lidar_pixels = np.empty((0, 2), dtype=np.float32)
+        self._lidar_indices = np.empty((0, 2), dtype=np.int32)
         bound_x = 0.5 + self._parent.bounding_box.extent.x
         bound_y = 0.5 + self._parent.bounding_box.extent.y
         bound_z = 0.5 + self._parent.bounding_box.extent.z
@@ -1240,6 +1252,9 @@ class CameraManager(object):
 
             item.append(bp)
         self.index = None
+        weak_self = weakref.ref(self)
+        threading.Thread(target=CameraManager._convert_loop, args=(weak_self, self._pending), name='camera-converter', daemon=True).start()
+        threading.Thread(target=CameraManager._record_loop, args=(weak_self, self._recordings), name='camera-recorder', daemon=True).start()
 
     def toggle_camera(self):
         self.transform_index = (self.transform_index + 1) % len(self._camera_transforms)
@@ -1252,7 +1267,10 @@ class CameraManager(object):
         if needs_respawn:
             if self.sensor is not None:
                 self.sensor.destroy()
-                self.surface = None
+                # Images of the old sensor still queued or being converted are discarded
+                with self._surface_lock:
+                    self._generation += 1
+                    self.surface = None
             self.sensor = self._parent.get_world().spawn_actor(
                 self.sensors[index][-1],
                 self._camera_transforms[self.transform_index][0],
@@ -1261,7 +1279,8 @@ class CameraManager(object):
             # We need to pass the lambda a weak reference to self to avoid
             # circular reference.
             weak_self = weakref.ref(self)
-            self.sensor.listen(lambda image: CameraManager._parse_image(weak_self, image))
+            generation = self._generation
+            self.sensor.listen(lambda image: CameraManager._parse_image(weak_self, image, index, generation))
         if notify:
             self.hud.notification(self.sensors[index][2])
         self.index = index
@@ -1272,10 +1291,16 @@ class CameraManager(object):
     def toggle_recording(self):
         self.recording = not self.recording
         self.hud.notification('Recording %s' % ('On' if self.recording else 'Off'))
+        if not self.recording and self.dropped_recordings:
+            logging.warning('%d camera images were not recorded, the disk could not keep up', self.dropped_recordings)
 
     def render(self, display):
-        if self.surface is not None:
-            display.blit(self.surface, (0, 0)) # self.surface is the image from camera sensor
+        # The worker never writes into the front surface, the lock only guards the swap
+        with self._surface_lock:
+            surface = self.surface
+            if surface is not None:
+                display.blit(surface, (0, 0)) # self.surface is the image from camera sensor
+        if surface is not None:
             left_lane_points, right_lane_points = lane_detector.detect(self.sensor)
             if len(left_lane_points) > 0:
                 for left_lane_point, right_lane_point in zip(left_lane_points, right_lane_points):
@@ -1285,49 +1310,142 @@ class CameraManager(object):
                     except Exception:
                         continue
 
+    def _get_lidar_buffers(self, width, height, n_points):
+        # One image per resolution, and point buffers that only grow, reused every frame
+        if (width, height) not in self._lidar_pool:
+            self._lidar_pool[(width, height)] = np.zeros((width, height, 3), dtype=np.uint8)
+        if len(self._lidar_pixels) < n_points:
+            capacity = max(n_points, 2 * len(self._lidar_pixels))
+            self._lidar_pixels = np.empty((capacity, 2), dtype=np.float32)
+            self._lidar_indices = np.empty((capacity, 2), dtype=np.int32)
+        return self._lidar_pool[(width, height)], self._lidar_pixels[:n_points], self._lidar_indices[:n_points]
+
+    def _get_back_surface(self, size):
+        # Two surfaces per resolution, the back one is whichever is not displayed
+        if size not in self._surfaces:
+            self._surfaces[size] = (pygame.Surface(size, depth=24), pygame.Surface(size, depth=24))
+        front, back = self._surfaces[size]
+        return back if self.surface is front else front
+
     @staticmethod
-    def _parse_image(weak_self, image):
+    def _parse_image(weak_self, image, index, generation):
         self = weak_self()
         if not self:
             return
-        if self.sensors[self.index][0].startswith('sensor.lidar'):
+        if self.recording:
+            # No disk write on the sensor thread, the writer saves the image and then hands it to the converter
+            try:
+                self._recordings.put_nowait((image, index, generation))
+            except queue.Full:
+                self.dropped_recordings += 1
+                self._offer(image, index, generation)
+            return
+        self._offer(image, index, generation)
+
+    def _offer(self, image, index, generation):
+        # Drop the image still waiting for the worker, only the latest one is displayed. The sensor thread and
+        # the recorder can both offer images, so retry until this one is queued
+        while True:
+            try:
+                self._pending.put_nowait((image, index, generation))
+                return
+            except queue.Full:
+                try:
+                    self._pending.get_nowait()
+                    self.dropped_frames += 1
+                except queue.Empty:
+                    pass
+
+    @staticmethod
+    def _record(image, sensor):
+        if sensor[0].startswith('sensor.camera.optical_flow'):
+            image.get_color_coded_flow().save_to_disk('_out/%08d' % image.frame)
+        elif sensor[0].startswith('sensor.camera') and not sensor[0].startswith('sensor.camera.dvs'):
+            image.save_to_disk('_out/%08d' % image.frame, sensor[1])
+        else:
+            image.save_to_disk('_out/%08d' % image.frame)
+
+    @staticmethod
+    def _record_loop(weak_self, recordings):
+        # Same lifetime as the converter thread, every queued image is saved in order
+        while True:
+            try:
+                image, index, generation = recordings.get(timeout=1.0)
+            except queue.Empty:
+                if weak_self() is None:
+                    return
+                continue
+            self = weak_self()
+            if self is None:
+                return
+            try:
+                CameraManager._record(image, self.sensors[index])
+            except Exception:
+                logging.exception('Failed to record the camera image')
+            self._offer(image, index, generation)
+            del self
+
+    @staticmethod
+    def _convert_loop(weak_self, pending):
+        # Holds the camera manager only while converting, and stops once it is garbage collected
+        while True:
+            try:
+                image, index, generation = pending.get(timeout=1.0)
+            except queue.Empty:
+                if weak_self() is None:
+                    return
+                continue
+            self = weak_self()
+            if self is None:
+                return
+            try:
+                self._convert_image(image, index, generation)
+            except Exception:
+                logging.exception('Failed to convert the camera image')
+            del self
+
+    def _convert_image(self, image, index, generation):
+        if generation != self._generation:
+            return
+        if self.sensors[index][0].startswith('sensor.lidar'):
             points = np.frombuffer(image.raw_data, dtype=np.dtype('f4'))
             points = np.reshape(points, (int(points.shape[0] / 4), 4))
-            lidar_data = np.array(points[:, :2])
-            lidar_data *= min(self.hud.dim) / (2.0 * self.lidar_range)
-            lidar_data += (0.5 * self.hud.dim[0], 0.5 * self.hud.dim[1])
-            lidar_data = np.fabs(lidar_data)  # pylint: disable=E1111
-            lidar_data = lidar_data.astype(np.int32)
-            lidar_data = np.reshape(lidar_data, (-1, 2))
-            lidar_img_size = (self.hud.dim[0], self.hud.dim[1], 3)
-            lidar_img = np.zeros((lidar_img_size), dtype=np.uint8)
-            lidar_img[tuple(lidar_data.T)] = (255, 255, 255)
-            self.surface = pygame.surfarray.make_surface(lidar_img)
-        elif self.sensors[self.index][0].startswith('sensor.camera.dvs'):
+            width, height = self.hud.dim
+            lidar_img, pixels, indices = self._get_lidar_buffers(width, height, len(points))
+            # Scale to pixels in the preallocated buffers, floor so that negative coordinates stay negative
+            np.multiply(points[:, :2], min(width, height) / (2.0 * self.lidar_range), out=pixels)
+            pixels += (0.5 * width, 0.5 * height)
+            np.floor(pixels, out=pixels)
+            np.copyto(indices, pixels, casting='unsafe')
+            # Points outside the image are dropped, not folded back into it
+            inside = (indices[:, 0] >= 0) & (indices[:, 0] < width) & (indices[:, 1] >= 0) & (indices[:, 1] < height)
+            lidar_img.fill(0)
+            lidar_img[indices[inside, 0], indices[inside, 1]] = 255
+            array = lidar_img
+        elif self.sensors[index][0].startswith('sensor.camera.dvs'):
             # Example of converting the raw_data from a carla.DVSEventArray
             # sensor into a NumPy array and using it as an image
             dvs_events = np.frombuffer(image.raw_data, dtype=np.dtype([
-                ('x', np.uint16), ('y', np.uint16), ('t', np.int64), ('pol', np.bool)]))
+                ('x', np.uint16), ('y', np.uint16), ('t', np.int64), ('pol', np.bool_)]))
             dvs_img = np.zeros((image.height, image.width, 3), dtype=np.uint8)
             # Blue is positive, red is negative
             dvs_img[dvs_events[:]['y'], dvs_events[:]['x'], dvs_events[:]['pol'] * 2] = 255
-            self.surface = pygame.surfarray.make_surface(dvs_img.swapaxes(0, 1))
-        elif self.sensors[self.index][0].startswith('sensor.camera.optical_flow'):
-            image = image.get_color_coded_flow()
-            array = np.frombuffer(image.raw_data, dtype=np.dtype("uint8"))
-            array = np.reshape(array, (image.height, image.width, 4))
-            array = array[:, :, :3]
-            array = array[:, :, ::-1]
-            self.surface = pygame.surfarray.make_surface(array.swapaxes(0, 1))
+            array = dvs_img.swapaxes(0, 1)
         else:
-            image.convert(self.sensors[self.index][1])
+            if self.sensors[index][0].startswith('sensor.camera.optical_flow'):
+                image = image.get_color_coded_flow()
+            else:
+                image.convert(self.sensors[index][1])
             array = np.frombuffer(image.raw_data, dtype=np.dtype("uint8"))
             array = np.reshape(array, (image.height, image.width, 4))
-            array = array[:, :, :3]
-            array = array[:, :, ::-1]
-            self.surface = pygame.surfarray.make_surface(array.swapaxes(0, 1))
-        if self.recording:
-            image.save_to_disk('_out/%08d' % image.frame)
+            # BGRA rows to RGB columns as a view, copied once by blit_array
+            array = array[:, :, 2::-1].swapaxes(0, 1)
+
+        surface = self._get_back_surface(array.shape[:2])
+        pygame.surfarray.blit_array(surface, array)
+        with self._surface_lock:
+            if generation == self._generation:
+                self.surface = surface
 
 
 # ==============================================================================